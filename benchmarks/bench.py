@@ -0,0 +1,181 @@
+"""
+Benchmark suite for memSim.py.
+
+Generates large reproducible traces, times every replacement policy engine and the TLB on
+them, and writes the numbers (references per second, peak memory) as JSON. Compare a run
+against a stored baseline to catch regressions in the hot loops:
+
+    python3 benchmarks/bench.py --save baseline.json
+    python3 benchmarks/bench.py --baseline baseline.json
+"""
+from typing import List
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import memSim # noqa: E402
+
+BACKING_STORE = os.path.join(ROOT, 'BACKING_STORE.bin')
+NUM_PAGES = memSim.PAGE_TABLE_SIZE
+PAGE_SIZE = memSim.PAGE_SIZE
+
+# WORKLOAD GENERATORS, each returns a list of n addresses, the same list for the same seed
+def _addresses(pages: List[int], rng: random.Random):
+    return [page * PAGE_SIZE + rng.randrange(PAGE_SIZE) for page in pages]
+
+def uniform(n: int, seed: int):
+    rng = random.Random(seed)
+    return _addresses([rng.randrange(NUM_PAGES) for _ in range(n)], rng)
+
+def zipfian(n: int, seed: int, s: float=1.1):
+    rng = random.Random(seed)
+    weights = list(itertools.accumulate(1 / (rank + 1)**s for rank in range(NUM_PAGES)))
+    ranks = rng.choices(range(NUM_PAGES), cum_weights=weights, k=n)
+    order = list(range(NUM_PAGES)) # hot pages spread over the address space
+    rng.shuffle(order)
+    return _addresses([order[rank] for rank in ranks], rng)
+
+def sequential(n: int, seed: int): # repeated scans over every page, a few references per page
+    rng = random.Random(seed)
+    return _addresses([(i // 4) % NUM_PAGES for i in range(n)], rng)
+
+def looping(n: int, seed: int, loopPages: int=48): # a working set a bit bigger than a small memory
+    rng = random.Random(seed)
+    return _addresses([(i // 2) % loopPages for i in range(n)], rng)
+
+def phases(n: int, seed: int, phaseLength: int=20000, setSize: int=24): # working set moves every phase
+    rng = random.Random(seed)
+    pages = []
+    while len(pages) < n:
+        base = rng.randrange(NUM_PAGES)
+        pages.extend((base + rng.randrange(setSize)) % NUM_PAGES for _ in range(min(phaseLength, n - len(pages))))
+    return _addresses(pages, rng)
+
+def strided(n: int, seed: int, stride: int=7):
+    rng = random.Random(seed)
+    return _addresses([(i * stride) % NUM_PAGES for i in range(n)], rng)
+
+WORKLOADS = {'uniform': uniform, 'zipfian': zipfian, 'sequential': sequential,
+             'looping': looping, 'phases': phases, 'strided': strided}
+
+# MEASUREMENTS
+def runPolicy(pra: str, trace: List[int], frames: int):
+    """ One full simulation with stats only output, returns the Simulator. """
+    memory = memSim.RAM(size=frames)
+    disk = memSim.Disk(BACKING_STORE)
+    output = memSim.OutputWriter(memory, level='stats', filename=os.devnull)
+    pages = [address // PAGE_SIZE for address in trace] if pra == 'opt' else None
+    sim = memSim.Simulator(memSim.makePageTable('flat', NUM_PAGES, frames), memSim.TLB(), memory, disk,
+                           memSim.makePolicy(pra, frames, pages), output)
+    sim.run(trace)
+    output.close()
+    disk.close()
+    return sim
+
+def runTLB(trace: List[int], size: int=memSim.TLB_SIZE):
+    """ TLB on its own: look every page up and add it on a miss. """
+    tlb = memSim.TLB(size=size)
+    for address in trace:
+        p = address // PAGE_SIZE
+        if tlb.lookup(p) is None:
+            tlb.add(p, p)
+
+def measure(fn, refs: int, repeat: int):
+    """ Best wall time over repeat runs, then one more run under tracemalloc for the peak. """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': best, 'refs_per_sec': refs / best if best else 0.0, 'peak_bytes': peak}
+
+def runSuite(refs: int, frames: int, seed: int, repeat: int, workloads: List[str], policies: List[str]):
+    results = {}
+    for name in workloads:
+        trace = WORKLOADS[name](refs, seed)
+        for pra in policies:
+            row = measure(lambda: runPolicy(pra, trace, frames), refs, repeat)
+            row['page_faults'] = runPolicy(pra, trace, frames).pageFaults # sanity check, should never change
+            results[f'{name}/{pra}'] = row
+            print(f'{name:>10} {pra:>6} {row["refs_per_sec"]:>12,.0f} refs/s {row["peak_bytes"] / 1024:>10,.0f} KiB', file=sys.stderr)
+        row = measure(lambda: runTLB(trace), refs, repeat)
+        results[f'{name}/tlb'] = row
+        print(f'{name:>10} {"tlb":>6} {row["refs_per_sec"]:>12,.0f} refs/s {row["peak_bytes"] / 1024:>10,.0f} KiB', file=sys.stderr)
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """ Print every benchmark that got slower by more than threshold, return how many did. """
+    regressions = 0
+    for key, row in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        change = row['refs_per_sec'] / old['refs_per_sec'] - 1
+        mark = ''
+        if change < -threshold:
+            regressions += 1
+            mark = '  REGRESSION'
+        if old.get('page_faults') is not None and row.get('page_faults') != old['page_faults']:
+            regressions += 1
+            mark += f'  page faults {old["page_faults"]} -> {row["page_faults"]}'
+        print(f'{key:>20} {change:>+8.1%}{mark}', file=sys.stderr)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="memSim benchmarks")
+    parser.add_argument("--refs", type=int, default=200000, help="References per trace. Default is 200000.")
+    parser.add_argument("--frames", type=int, default=32, help="Frames of physical memory. Default is 32.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the trace generators. Default is 1.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark, the best one counts. Default is 3.")
+    parser.add_argument("--workloads", type=str, default=",".join(WORKLOADS),
+                        help=f"Comma separated workloads. Default is {','.join(WORKLOADS)}.")
+    parser.add_argument("--policies", type=str, default="fifo,lru,opt",
+                        help="Comma separated replacement algorithms. Default is fifo,lru,opt.")
+    parser.add_argument("--save", type=str, metavar="FILE", help="Write the results as JSON to FILE.")
+    parser.add_argument("--baseline", type=str, metavar="FILE", help="Compare against the JSON results in FILE.")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Slowdown that counts as a regression. Default is 0.10 (10%%).")
+    args = parser.parse_args()
+
+    workloads = args.workloads.split(",")
+    policies = args.policies.split(",")
+    for name in workloads:
+        if name not in WORKLOADS:
+            parser.error(f"unknown workload {name!r}")
+    for pra in policies:
+        if pra not in memSim.POLICIES:
+            parser.error(f"unknown policy {pra!r}")
+
+    report = {'config': {'refs': args.refs, 'frames': args.frames, 'seed': args.seed, 'repeat': args.repeat,
+                         'python': platform.python_version(), 'machine': platform.machine()},
+              'results': runSuite(args.refs, args.frames, args.seed, args.repeat, workloads, policies)}
+    text = json.dumps(report, indent=2)
+    if args.save:
+        with open(args.save, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config', {}).get('refs') != args.refs or baseline.get('config', {}).get('seed') != args.seed:
+            print('warning: baseline was made with different --refs/--seed', file=sys.stderr)
+        if compare(report['results'], baseline['results'], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
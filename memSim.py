@@ -1,7 +1,25 @@
 from typing import List
-from queue import Queue
+from collections import OrderedDict, defaultdict, deque
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 import argparse
+import asyncio
+import gzip
+import heapq
+import itertools
+import json
+import lzma
+import mmap
+import os
+import pickle
+import random
+import signal
+import struct
+import sys
+import tempfile
+import time
 
+# defaults, all of these can be changed from the command line
 PAGE_TABLE_SIZE = 2**8
 PAGE_SIZE = 2**8 # bytes
 FRAME_SIZE = PAGE_SIZE
@@ -10,520 +28,2934 @@ TLB_SIZE = 16
 
 class TLB: 
     """
-    Pretty much just a cache, FIFO. Implementing using a circular queue. 
-    The .add() method will add a page, frame pair to the tlb.
-    The .contains() method will check if a page is in the tlb.
-    The .getitem() method will return the frame number associated with a page number.
-    We are doing a linear search here becasue the tlb is small.
+    Pretty much just a cache. The TLB is split into size // ways sets of ways entries
+    (ways == size is fully associative, ways == 1 is direct-mapped) and page p can only
+    live in set p % sets. Every entry is indexed by a dict, so .lookup() is a single hash
+    probe however big the TLB is.
+    The .add() method will add a page, frame pair to the tlb, evicting from the page's set if it is full.
+    The .lookup() method returns the frame number associated with a page number, or None on a miss.
+    Replacement inside a set is 'fifo' (circular queue), 'lru' or 'random'.
     """
-    def __init__(self, size: int=TLB_SIZE):
+    def __init__(self, size: int=TLB_SIZE, ways: int=None, policy: str="fifo", seed: int=0):
+        ways = size if ways is None else ways
+        if ways < 1 or size % ways:
+            raise ValueError(f'a {size} entry TLB can\'t be split into {ways} way sets')
         self.size = size
-        self.tlb = []
-        self.evictionIndex = 0 # need to keep track of what we want to evict
+        self.ways = ways
+        self.numSets = size // ways
+        self.policy = policy
+        rng = random.Random(seed)
+        if policy == "fifo":
+            self.sets = [FIFOSet(ways) for _ in range(self.numSets)]
+        elif policy == "lru":
+            self.sets = [LRUSet(ways) for _ in range(self.numSets)]
+        elif policy == "random":
+            self.sets = [RandomSet(ways, rng) for _ in range(self.numSets)]
+        else:
+            raise ValueError(f'unknown TLB replacement policy {policy!r}')
+        self.touch = policy == "lru" # only LRU cares about hits
+        self.index = {} # page number -> ListNode(page number, frame number)
 
+    def lookup(self, pageNumber: int): # frame number on a hit, None on a miss
+        node = self.index.get(pageNumber)
+        if node is None:
+            return None
+        if self.touch:
+            self.sets[pageNumber % self.numSets].touch(node)
+        return node.value
     def add(self, pageNumber: int, frameNumber: int):
-        # if the tlb is full, remove the first element
-        if len(self.tlb) < self.size: # if the tlb is not full
-            self.tlb.append((pageNumber, frameNumber))
-        else: # if the tlb is full
-            self.tlb[self.evictionIndex] = (pageNumber, frameNumber)
-            self.evictionIndex = (self.evictionIndex + 1) % self.size
+        if pageNumber in self.index: # replace the old translation
+            self.deleteitem(pageNumber)
+        node = ListNode(pageNumber, frameNumber)
+        victim = self.sets[pageNumber % self.numSets].insert(node)
+        if victim is not None:
+            del self.index[victim.key]
+        self.index[pageNumber] = node
     def contains(self, pageNumber: int):
-        for page, frame in self.tlb:
-            if page == pageNumber:
-                return True
-        return False
+        return pageNumber in self.index
     def getitem(self, pageNumber: int):
-        for page, frame in self.tlb:
-            if page == pageNumber:
-                return frame
-        return None # if not found
+        node = self.index.get(pageNumber)
+        return None if node is None else node.value # None if not found
     def deleteitem(self, pageNumber: int):
-        for i, (page, frame) in enumerate(self.tlb):
-            if page == pageNumber:
-                if i < self.evictionIndex: # so taht we keep our eviction index correct
-                    self.evictionIndex-=1
-                self.tlb.pop(i)
-                return True
-        return False
+        node = self.index.pop(pageNumber, None)
+        if node is None:
+            return False
+        self.sets[pageNumber % self.numSets].remove(node)
+        return True
+    def flush(self): # drop every translation, for context switches without ASIDs
+        for pageNumber in list(self.index):
+            self.deleteitem(pageNumber)
+    def entries(self): # (page, frame) pairs, set by set
+        return [(node.key, node.value) for tlbSet in self.sets for node in tlbSet.nodes()]
 
     def __str__(self):
-        return repr(self.tlb)
+        return repr(self.entries())
+
+# TLB SETS, each one holds up to ways ListNodes and picks the victim when it is full
+class FIFOSet:
+    """
+    Circular queue. Entries sit in a linked list in slot order and evict points at the
+    next slot to overwrite; the tail sentinel stands for "past the last slot". Deleting an
+    entry closes the gap and new entries are appended at the end until the set is full
+    again, exactly like the list + eviction index this TLB used to be, but every
+    operation is O(1).
+    """
+    def __init__(self, ways: int):
+        self.ways = ways
+        self.count = 0
+        self.head = ListNode(-1, -1) # dummy head
+        self.tail = ListNode(-1, -1) # dummy tail
+        self.head.next = self.tail
+        self.tail.prev = self.head
+        self.evict = self.tail # slot to overwrite next
+
+    def insert(self, node): # returns the evicted node, or None
+        if self.count < self.ways: # not full, append
+            _link(node, self.tail.prev, self.tail)
+            if self.evict is self.tail:
+                self.evict = node
+            self.count += 1
+            return None
+        victim = self.evict # full, overwrite the slot in place
+        _link(node, victim.prev, victim.next)
+        self.evict = node.next if node.next is not self.tail else self.head.next
+        return victim
+    def remove(self, node):
+        if node is self.evict:
+            self.evict = node.next
+        _unlink(node)
+        self.count -= 1
+    def touch(self, node):
+        pass
+    def nodes(self):
+        node = self.head.next
+        while node is not self.tail:
+            yield node
+            node = node.next
+
+    def __getstate__(self): # the nodes in order, pickling the links would recurse once per node
+        nodes = list(self.nodes())
+        evict = nodes.index(self.evict) if self.evict is not self.tail else len(nodes)
+        return self.ways, nodes, evict
+    def __setstate__(self, state):
+        ways, nodes, evict = state
+        self.__init__(ways)
+        for node in nodes:
+            _link(node, self.tail.prev, self.tail)
+        self.count = len(nodes)
+        self.evict = nodes[evict] if evict < len(nodes) else self.tail
+
+class LRUSet(FIFOSet):
+    """ Least recently used entry at the front of the list, most recent at the back. """
+    def insert(self, node):
+        victim = None
+        if self.count == self.ways:
+            victim = self.head.next
+            self.remove(victim)
+        _link(node, self.tail.prev, self.tail)
+        self.count += 1
+        return victim
+    def touch(self, node):
+        _unlink(node)
+        _link(node, self.tail.prev, self.tail)
+
+class RandomSet:
+    """ Evicts a random entry. Entries live in a list, removal swaps the last one into the gap. """
+    def __init__(self, ways: int, rng):
+        self.ways = ways
+        self.rng = rng
+        self.slots = []
+        self.pos = {} # page number -> index in slots
+
+    def insert(self, node):
+        victim = None
+        if len(self.slots) == self.ways:
+            victim = self.slots[self.rng.randrange(self.ways)]
+            self.remove(victim)
+        self.pos[node.key] = len(self.slots)
+        self.slots.append(node)
+        return victim
+    def remove(self, node):
+        i = self.pos.pop(node.key)
+        last = self.slots.pop()
+        if last is not node:
+            self.slots[i] = last
+            self.pos[last.key] = i
+    def touch(self, node):
+        pass
+    def nodes(self):
+        return iter(self.slots)
+
+def _link(node, prev, nxt): # put node between prev and nxt
+    node.prev = prev
+    node.next = nxt
+    prev.next = node
+    nxt.prev = node
+
+def _unlink(node):
+    node.prev.next = node.next
+    node.next.prev = node.prev
 
 
 class PageTable: # include a loaded bit for each entry
+    """
+    Flat page table, and the interface every page table backend follows:
+    .lookup() is a counted page walk and returns the frame of a loaded page (or None),
+    .map()/.unmap() load and evict a page, .pageof() is the frame -> page reverse lookup.
+    walkAccesses counts the memory accesses page walks cost, levelAccesses splits that
+    count per level of the table.
+    Sparse: size is the number of pages in the virtual address space, but a PTEntry is only
+    created the first time a page is touched, so memory grows with the pages the trace uses
+    rather than with the address space (2^36 pages for 48 bits).
+    """
+    levels = 1
+
     def __init__(self, size: int=PAGE_TABLE_SIZE):
         self.size = size
-        self.pageTable = [PTEntry() for _ in range(size)] # list of PTEntries
-    def contains(self, pageNumber: int): # check if page is loaded into memory
-        return self.pageTable[pageNumber].loadedBit == 1
+        self.pageTable = defaultdict(PTEntry) # page number -> PTEntry
+        self.frameToPage = {} # inverted map, frame number -> page number
+        self.walks = 0
+        self.walkAccesses = 0
+        self.levelAccesses = [0] * self.levels
+    def _walk(self, pageNumber: int):
+        # returns (PTEntry or None, number of levels read), doesn't touch the counters
+        return self.pageTable.get(pageNumber), 1
+    def _entry(self, pageNumber: int): # PTEntry for the page, created if needed
+        return self.pageTable[pageNumber]
+    def lookup(self, pageNumber: int): # page walk, returns the frame number or None on a page fault
+        entry, accesses = self._walk(pageNumber)
+        self.walks += 1
+        self.walkAccesses += accesses
+        for level in range(accesses):
+            self.levelAccesses[level] += 1
+        if entry is None or entry.loadedBit == 0:
+            if not 0 <= pageNumber < self.size:
+                raise IndexError(f'page {pageNumber} is outside the {self.size} page address space')
+            return None
+        return entry.frameNumber
+    def contains(self, pageNumber: int): # check if page is loaded into memory, not counted as a walk
+        entry = self._walk(pageNumber)[0]
+        return entry is not None and entry.loadedBit == 1
     def getframe(self, pageNumber: int): # get the frame associated with the page number
-        return self.pageTable[pageNumber].frameNumber
+        entry = self._walk(pageNumber)[0]
+        return None if entry is None else entry.frameNumber
+    def entry(self, pageNumber: int): # the PTEntry of a page, None if it was never loaded, not counted as a walk
+        return self._walk(pageNumber)[0]
+    def map(self, pageNumber: int, frameNumber: int): # page was loaded into frameNumber
+        entry = self._entry(pageNumber)
+        entry.frameNumber = frameNumber
+        entry.loadedBit = 1
+        entry.referencedBit = 0
+        entry.dirtyBit = 0 # fresh from disk
+        self.frameToPage[frameNumber] = pageNumber
+    def unmap(self, pageNumber: int): # page was evicted
+        entry = self._walk(pageNumber)[0]
+        if entry is not None and entry.loadedBit == 1:
+            del self.frameToPage[entry.frameNumber]
+            entry.frameNumber = None
+            entry.loadedBit = 0
+    def setdirty(self, pageNumber: int): # the loaded page was written to
+        self._walk(pageNumber)[0].dirtyBit = 1
+    def isdirty(self, pageNumber: int): # has the loaded page been written to since it was loaded
+        entry = self._walk(pageNumber)[0]
+        return entry is not None and entry.dirtyBit == 1
+    def pageof(self, frameNumber: int): # O(1) reverse lookup, None if the frame is free
+        return self.frameToPage.get(frameNumber)
+    def items(self): # (page number, PTEntry) for every entry in the table
+        return self.pageTable.items()
+    def walkCost(self): # average memory accesses per page walk
+        return self.walkAccesses / self.walks if self.walks else 0.0
     def print(self):
-        for i in range(self.size):
-            if self.pageTable[i].frameNumber is not None:
-                print(f'Page Number: {i}, Frame Number: {self.pageTable[i].frameNumber}, Loaded Bit: {self.pageTable[i].loadedBit}')
-    def findLongestUnused(self, futurePages: List[int]):
-        """
-        This method is needed for the OPT page replacement algorithm.
-        Future pages is a list of page numbers that will be referenced in the future.
-        Goal: Find the page that is currently in the page table that will not be used for the longest time.
-        1.) Get all the pages that are currently loaded into memory.
-        2.) For each page, find the index of the next time it will be referenced.
-        3.) Return the page with the longest time until next reference.
-            -- time = index in futurePages, we want to return the largest index
-            -- return a page frame pair
-        """
-        # 1.) Get all the pages that are currently loaded into memory.
-        loadedPages = []
-        for i in range(self.size):
-            if self.pageTable[i].loadedBit == 1:
-                loadedPages.append((i, self.pageTable[i].frameNumber)) # append a tuple of (page, frame)
-        # 2.) For each page, find the index of the next time it will be referenced.
-        longestUnused = None
-        maxInd = -1
-        for page in loadedPages:
-            used = False
-            for i in range(len(futurePages)):
-                if page[0] == futurePages[i]:
-                    used = True
-                    if i > maxInd:
-                        maxInd = i
-                        longestUnused = page
-                    break
-            if not used:
-                return page
-        if longestUnused is None: 
-        # none of the currently loaded pages are reference in the future, so just evict the first one
-            return loadedPages[0]
-        return longestUnused
-       
+        for i, entry in sorted(self.items()):
+            if entry.frameNumber is not None:
+                print(f'Page Number: {i}, Frame Number: {entry.frameNumber}, Loaded Bit: {entry.loadedBit}')
+
+class RadixPageTable(PageTable):
+    """
+    Multi-level (radix) page table, like x86. The page number bits are split between the
+    levels, the top level gets any left over bits. Each level is a dict so only the
+    directories a trace touches exist. A walk costs one memory access per level it reads,
+    it stops early at a missing directory.
+    """
+    def __init__(self, size: int=PAGE_TABLE_SIZE, levels: int=2):
+        self.levels = levels
+        super().__init__(size)
+        self.pageTable = {} # root directory
+        bits = max(size - 1, 1).bit_length()
+        perLevel = [bits // levels] * levels
+        perLevel[0] += bits % levels
+        self.shifts = [sum(perLevel[level + 1:]) for level in range(levels)]
+        self.masks = [(1 << width) - 1 for width in perLevel]
+    def _walk(self, pageNumber: int):
+        if not 0 <= pageNumber < self.size: # the masks would wrap it onto a page inside
+            return None, 1
+        node = self.pageTable
+        for level in range(self.levels):
+            node = node.get((pageNumber >> self.shifts[level]) & self.masks[level])
+            if node is None:
+                return None, level + 1
+        return node, self.levels
+    def _entry(self, pageNumber: int):
+        if not 0 <= pageNumber < self.size:
+            raise IndexError(f'page {pageNumber} is outside the {self.size} page address space')
+        node = self.pageTable
+        for level in range(self.levels - 1):
+            node = node.setdefault((pageNumber >> self.shifts[level]) & self.masks[level], {})
+        index = pageNumber & self.masks[-1]
+        entry = node.get(index)
+        if entry is None:
+            entry = node[index] = PTEntry()
+        return entry
+    def items(self):
+        def walk(node, level, prefix):
+            for index, child in node.items():
+                page = (prefix << (self.masks[level].bit_length())) | index
+                if level == self.levels - 1:
+                    yield page, child
+                else:
+                    yield from walk(child, level + 1, page)
+        return walk(self.pageTable, 0, 0)
+
+class InvertedPageTable(PageTable):
+    """
+    Hashed inverted page table, like PowerPC. There is one entry per frame instead of
+    one per page, so the table's size follows physical memory no matter how big the
+    address space is. A hash anchor table points at the first frame of each chain and
+    frames holding pages with the same hash are chained together.
+    A walk costs one access for the anchor table plus one per chain entry read
+    (levelAccesses[0] counts anchor reads, levelAccesses[1] chain reads).
+    """
+    levels = 2
+
+    def __init__(self, size: int=PAGE_TABLE_SIZE, frames: int=PAGE_TABLE_SIZE):
+        super().__init__(size)
+        self.pageTable = None # the frame arrays below are the table
+        self.hashBits = max(frames - 1, 1).bit_length()
+        self.anchors = [-1] * (1 << self.hashBits) # hash -> first frame of the chain
+        self.pages = [-1] * frames # frame -> page number held, -1 if free
+        self.chain = [-1] * frames # frame -> next frame in the same chain
+        self.entries = [None] * frames # frame -> PTEntry of the page it holds
+    def _hash(self, pageNumber: int): # multiplicative hash, spreads out strided pages
+        return ((pageNumber * 0x9E3779B1) & 0xFFFFFFFF) >> (32 - self.hashBits)
+    def _find(self, pageNumber: int): # (frame or -1, chain entries read)
+        frame = self.anchors[self._hash(pageNumber)]
+        reads = 0
+        while frame != -1:
+            reads += 1
+            if self.pages[frame] == pageNumber:
+                return frame, reads
+            frame = self.chain[frame]
+        return -1, reads
+    def _walk(self, pageNumber: int):
+        frame, reads = self._find(pageNumber)
+        return (self.entries[frame] if frame != -1 else None), 1 + reads
+    def lookup(self, pageNumber: int):
+        frame, reads = self._find(pageNumber)
+        self.walks += 1
+        self.walkAccesses += 1 + reads
+        self.levelAccesses[0] += 1
+        self.levelAccesses[1] += reads
+        if frame == -1:
+            if not 0 <= pageNumber < self.size:
+                raise IndexError(f'page {pageNumber} is outside the {self.size} page address space')
+            return None
+        return frame
+    def map(self, pageNumber: int, frameNumber: int):
+        bucket = self._hash(pageNumber)
+        self.pages[frameNumber] = pageNumber
+        self.chain[frameNumber] = self.anchors[bucket]
+        self.anchors[bucket] = frameNumber
+        self.entries[frameNumber] = PTEntry(frameNumber, 1)
+        self.frameToPage[frameNumber] = pageNumber
+    def unmap(self, pageNumber: int):
+        bucket = self._hash(pageNumber)
+        prev, frame = -1, self.anchors[bucket]
+        while frame != -1 and self.pages[frame] != pageNumber:
+            prev, frame = frame, self.chain[frame]
+        if frame == -1:
+            return
+        if prev == -1:
+            self.anchors[bucket] = self.chain[frame]
+        else:
+            self.chain[prev] = self.chain[frame]
+        self.pages[frame] = -1
+        self.chain[frame] = -1
+        self.entries[frame] = None
+        del self.frameToPage[frame]
+    def items(self):
+        return ((page, self.entries[frame]) for frame, page in enumerate(self.pages) if page != -1)
+
+class ArrayPageTable(PageTable):
+    """
+    Flat page table held in parallel arrays indexed by page number instead of one PTEntry
+    object per page: frame numbers in an array('i') (-1 when the page isn't loaded) and the
+    referenced and dirty bits in bytearrays, 6 bytes a page. The whole address space is
+    allocated up front, so makePageTable() only picks it when that is at most
+    ARRAY_PAGE_TABLE_MAX pages, bigger spaces get the sparse table.
+    .entry() returns a PTEntryView, which reads and writes the arrays.
+    """
+    def __init__(self, size: int=PAGE_TABLE_SIZE):
+        super().__init__(size)
+        self.pageTable = None # the arrays below are the table
+        self.frameNumbers = array('i', [-1]) * size
+        self.referencedBits = bytearray(size)
+        self.dirtyBits = bytearray(size)
+    def _walk(self, pageNumber: int):
+        return self.entry(pageNumber), 1
+    def lookup(self, pageNumber: int):
+        self.walks += 1
+        self.walkAccesses += 1
+        self.levelAccesses[0] += 1
+        if not 0 <= pageNumber < self.size:
+            raise IndexError(f'page {pageNumber} is outside the {self.size} page address space')
+        frameNumber = self.frameNumbers[pageNumber]
+        return frameNumber if frameNumber >= 0 else None
+    def contains(self, pageNumber: int):
+        return 0 <= pageNumber < self.size and self.frameNumbers[pageNumber] >= 0
+    def getframe(self, pageNumber: int):
+        if not 0 <= pageNumber < self.size:
+            return None
+        frameNumber = self.frameNumbers[pageNumber]
+        return frameNumber if frameNumber >= 0 else None
+    def entry(self, pageNumber: int): # a view of the page's slot, None outside the address space
+        return PTEntryView(self, pageNumber) if 0 <= pageNumber < self.size else None
+    def map(self, pageNumber: int, frameNumber: int):
+        self.frameNumbers[pageNumber] = frameNumber
+        self.referencedBits[pageNumber] = 0
+        self.dirtyBits[pageNumber] = 0
+        self.frameToPage[frameNumber] = pageNumber
+    def unmap(self, pageNumber: int):
+        frameNumber = self.getframe(pageNumber)
+        if frameNumber is not None:
+            del self.frameToPage[frameNumber]
+            self.frameNumbers[pageNumber] = -1
+    def setdirty(self, pageNumber: int):
+        self.dirtyBits[pageNumber] = 1
+    def isdirty(self, pageNumber: int):
+        return self.dirtyBits[pageNumber] == 1
+    def items(self): # only the loaded pages, in page order
+        return ((page, PTEntryView(self, page)) for page in sorted(self.frameToPage.values()))
 
 class Disk:  # AKA Backing Store
     """
-    The backing store can be represented by a dictionary of size 256
-    where the key is the page number and the value is all 256 bytes in the frame.
-    We can make the value an array of size 256, making it easy to offset into the frame.
+    The backing store is memory-mapped instead of being read into lists up front.
+    Page p is the pageSize bytes starting at p * pageSize, and getpage() hands out a
+    zero-copy memoryview of them, so the OS only reads a page in on its first fault.
+    Startup cost doesn't depend on the size of the file.
+    size is the size of the whole virtual address space in bytes. It can be much bigger
+    than the file (think 48 bit address spaces), pages past the end of the file read as zeros,
+    and so does the rest of a last page the file only covers part of.
+    Multi-process runs tag page numbers with an address space id above the numPages pages of
+    one space, every address space reads the same file (but gets its own overlay pages).
+    The backing store file is never modified. .writepage() is copy-on-write: written back
+    pages are collected and flushed batch pages at a time, sorted and merged into runs, to
+    an overlay file (overlay, or an anonymous temporary file), and from then on reads of
+    those pages come from the overlay. The overlay is only created on the first flush.
     """
-    def __init__(self, filename: str):
-        self.disk = self.file_to_frames(filename)
+    def __init__(self, filename: str, pageSize: int=PAGE_SIZE, size: int=DISK_SIZE, overlay: str=None,
+                 batch: int=64):
+        self.pageSize = pageSize
+        self.size = size
+        self.file = open(filename, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.disk = memoryview(self.mm)
+        self.numPages = size // pageSize
+        self.filePages = -(-len(self.mm) // pageSize) # pages actually backed by the file, the last one maybe partly
+        self.zeroPage = memoryview(bytes(pageSize))
+        tail = len(self.mm) % pageSize
+        self.lastPage = None # a partly backed last page, padded with zeros
+        if tail:
+            self.lastPage = memoryview(bytes(self.disk[len(self.mm) - tail:]) + bytes(pageSize - tail))
+        self.overlayName = overlay
+        self.overlay = None
+        self.batch = batch
+        self.pending = {} # page number -> bytes written back but not flushed yet
+        self.written = set() # pages that live in the overlay (or pending)
+        self.flushes = 0
 
-    @staticmethod
-    def file_to_frames(filename):
-        frames = {}
-        with open(filename, 'rb') as f:
-            for i in range(256):
-                frames[i] = list(f.read(256))
-        return frames
+    def getpage(self, pageNumber: int): # read only view of the page, no copy
+        if self.written and pageNumber in self.written:
+            return self._readback(pageNumber)
+        pageNumber %= self.numPages
+        if pageNumber >= self.filePages:
+            return self.zeroPage
+        if pageNumber == self.filePages - 1 and self.lastPage is not None:
+            return self.lastPage
+        start = pageNumber * self.pageSize
+        return self.disk[start:start + self.pageSize]
+
+    def writepage(self, pageNumber: int, data): # write back a dirty page, copies data
+        self.pending[pageNumber] = bytes(data)
+        self.written.add(pageNumber)
+        if len(self.pending) >= self.batch:
+            self.flush()
+    def _readback(self, pageNumber: int):
+        data = self.pending.get(pageNumber)
+        if data is None:
+            self.overlay.seek(pageNumber * self.pageSize)
+            data = self.overlay.read(self.pageSize).ljust(self.pageSize, b'\0') # always a whole page
+        return memoryview(data)
+    def flush(self): # one write per run of consecutive pages
+        if not self.pending:
+            return
+        if self.overlay is None:
+            self.overlay = open(self.overlayName, 'w+b') if self.overlayName else tempfile.TemporaryFile()
+        pages = sorted(self.pending)
+        start = 0
+        for i in range(1, len(pages) + 1):
+            if i == len(pages) or pages[i] != pages[i - 1] + 1:
+                self.overlay.seek(pages[start] * self.pageSize)
+                self.overlay.write(b''.join(self.pending[page] for page in pages[start:i]))
+                start = i
+        self.pending.clear()
+        self.flushes += 1
+
+    def discard(self, first: int, stop: int): # pages in [first, stop) read from the backing store again
+        for page in [page for page in self.written if first <= page < stop]:
+            self.written.discard(page)
+            self.pending.pop(page, None)
+    def snapshot(self): # what a checkpoint needs to rebuild the overlay
+        self.flush()
+        pages = None
+        if not self.overlayName: # a temporary overlay dies with the process, keep its pages
+            pages = {page: self._readback(page).tobytes() for page in self.written}
+        return {'overlay': self.overlayName, 'written': set(self.written), 'pages': pages}
+    def restore(self, state: dict):
+        if state['pages'] is not None:
+            for page, data in state['pages'].items():
+                self.writepage(page, data)
+        elif state['written']:
+            self.overlay = open(state['overlay'], 'r+b') # keep what was written back before
+            self.written = set(state['written'])
+
+    def close(self):
+        self.flush()
+        if self.overlay is not None:
+            self.overlay.close()
+        if self.lastPage is not None:
+            self.lastPage.release()
+        self.disk.release()
+        self.mm.close()
+        self.file.close()
 
 class RAM: # AKA Physical Memory
-    def __init__(self, size: int):
+    """
+    All frames live in one contiguous bytearray, frame f is the frameSize bytes
+    starting at f * frameSize. Free frames are kept in a min heap so setitem still
+    fills the lowest empty frame first, without scanning.
+    """
+    def __init__(self, size: int, frameSize: int=FRAME_SIZE):
         self.size = size
+        self.frameSize = frameSize
         self.free = size # decrement free frames when adding intial pages
-        self.ram = [None] * size # list of frames, each frame is a list/string of 256 bytes
-    def getitem(self, frameNumber: int):
-        return self.ram[frameNumber]
-    def setitem(self, frameData: List[int]):
+        self.ram = bytearray(size * frameSize)
+        self.view = memoryview(self.ram)
+        self.freeFrames = list(range(size)) # already a valid heap
+        self.frameHex = [None] * size # cached hex dump of each frame, None until asked for
+    def getitem(self, frameNumber: int): # view of the frame, no copy
+        start = frameNumber * self.frameSize
+        return self.view[start:start + self.frameSize]
+    def setitem(self, frameData):
         """
         Write frameData to RAM at the first empty spot. Since we are using LRU, 
         we can't just append to the RAM array, becasue we might be evicting frames out
-        of order. This will be O(N), This function returns the frame number where the data was written.
+        of order. This function returns the frame number where the data was written.
         If memory is full it will return None.
         """
-        for i in range(self.size):
-            if self.ram[i] is None:
-                self.ram[i] = frameData
-                self.free-=1
-                return i
-        return None
+        if not self.freeFrames:
+            return None
+        frameNumber = heapq.heappop(self.freeFrames)
+        self.replaceitem(frameNumber, frameData)
+        self.free-=1
+        return frameNumber
+    def replaceitem(self, frameNumber: int, frameData): # overwrite a frame that is in use
+        start = frameNumber * self.frameSize
+        self.view[start:start + len(frameData)] = frameData
+        self.frameHex[frameNumber] = None
+    def gethex(self, frameNumber: int): # upper case hex dump of the frame, encoded once per page-in
+        frameHex = self.frameHex[frameNumber]
+        if frameHex is None:
+            start = frameNumber * self.frameSize
+            frameHex = self.frameHex[frameNumber] = self.ram[start:start + self.frameSize].hex().upper().encode()
+        return frameHex
     def deleteitem(self, frameNumber: int):
-        self.ram[frameNumber] = None
+        heapq.heappush(self.freeFrames, frameNumber)
         self.free+=1
 
+    def __getstate__(self): # memoryviews can't be pickled, and the hex cache is rebuilt on demand
+        state = self.__dict__.copy()
+        del state['view'], state['frameHex']
+        return state
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.view = memoryview(self.ram)
+        self.frameHex = [None] * self.size
+
+class PartitionedRAM(RAM):
+    """
+    RAM for local replacement: the frames are still one shared pool, but every process may only
+    hold quotas[pid] of them. .free is the current process's remaining quota, so the Simulator
+    evicts one of its own pages once it is used up. .switch() swaps the quota in.
+    """
+    def __init__(self, size: int, quotas: List[int], frameSize: int=FRAME_SIZE):
+        super().__init__(size, frameSize)
+        self.budgets = list(quotas) # free frames left per process
+        self.current = 0
+        self.free = self.budgets[0]
+    def switch(self, pid: int):
+        self.budgets[self.current] = self.free
+        self.current = pid
+        self.free = self.budgets[pid]
+
 class PTEntry:
+    __slots__ = ('frameNumber', 'loadedBit', 'referencedBit', 'dirtyBit')
+
     def __init__(self, frameNumber: int=None, loadedBit: int=0):
         self.frameNumber = frameNumber # 0 == not loaded into RAM, 1 == loaded
         self.loadedBit = loadedBit 
+        self.referencedBit = 0 # set when the page is used, cleared by CLOCK style algorithms
+        self.dirtyBit = 0 # set when the page is written to
+
+    def __repr__(self):
+        return repr((self.frameNumber, self.loadedBit, self.referencedBit, self.dirtyBit))
+
+class PTEntryView: # PTEntry interface over one page of an ArrayPageTable
+    __slots__ = ('table', 'page')
+
+    def __init__(self, table: ArrayPageTable, page: int):
+        self.table = table
+        self.page = page
+    @property
+    def frameNumber(self):
+        frameNumber = self.table.frameNumbers[self.page]
+        return frameNumber if frameNumber >= 0 else None
+    @property
+    def loadedBit(self):
+        return int(self.table.frameNumbers[self.page] >= 0)
+    @property
+    def referencedBit(self):
+        return self.table.referencedBits[self.page]
+    @referencedBit.setter
+    def referencedBit(self, bit: int):
+        self.table.referencedBits[self.page] = bit
+    @property
+    def dirtyBit(self):
+        return self.table.dirtyBits[self.page]
+    @dirtyBit.setter
+    def dirtyBit(self, bit: int):
+        self.table.dirtyBits[self.page] = bit
 
     def __repr__(self):
-        return repr("(%d, %d}", self.frameNumber, self.loadedBit)
+        return repr((self.frameNumber, self.loadedBit, self.referencedBit, self.dirtyBit))
 
 
-# OBJECTS FOR THE LRU IMPLEMENTATION:
+# OBJECT FOR THE TLB SETS:
 class ListNode: # doubly linked list node
+    __slots__ = ('key', 'value', 'prev', 'next')
+
     def __init__(self, key, value):
         self.key = key # page number
         self.value = value # frame number
         self.prev = None
         self.next = None
 
-class LRUCache: # keeps track of the LRU page IN MEMORY
-    def __init__(self, capacity):
-        self.capacity = capacity
-        self.hashmap = {}
-        self.head = ListNode(-1, -1) # dummy head
-        self.tail = ListNode(-1, -1) # dummy tail
-        self.head.next = self.tail
-        self.tail.prev = self.head
+    def __getstate__(self): # the set that holds the node pickles the order
+        return self.key, self.value
+    def __setstate__(self, state):
+        self.__init__(*state)
 
-    def _add_node(self, node):
-        node.prev = self.head
-        node.next = self.head.next
-        self.head.next.prev = node
-        self.head.next = node
+# OBJECT FOR THE OPT IMPLEMENTATION:
+class OPTCache: # keeps track of the page IN MEMORY whose next use is furthest away
+    """
+    Used by the OPT page replacement algorithm.
+    One backward pass over the whole reference string gives, for every position,
+    the position of the next reference to the same page (len(pages) if there is none).
+    Loaded pages sit in a heap keyed by their next use, so picking a victim is O(log F)
+    instead of rescanning the future pages on every fault.
+    Ties between pages that are never used again go to the lowest page number.
+    """
+    def __init__(self, pages: List[int]):
+        self.end = len(pages) # "never used again"
+        self.nextPos = self.next_positions(pages)
+        self.nextUse = {} # page number -> position of its next reference
+        self.heap = [] # (-next use, page number), may hold stale entries
 
-    def _remove_node(self, node):
-        prev = node.prev
-        new = node.next
-        prev.next = new
-        new.prev = prev
+    @staticmethod
+    def next_positions(pages: List[int]):
+        nextPos = array('q', [0]) * len(pages)
+        last = {}
+        for i in range(len(pages) - 1, -1, -1):
+            page = pages[i]
+            nextPos[i] = last.get(page, len(pages))
+            last[page] = i
+        return nextPos
 
-    def _move_to_head(self, node):
-        self._remove_node(node)
-        self._add_node(node)
+    def put(self, index: int, page: int): # page was referenced at position index of the trace
+        nextUse = self.nextPos[index]
+        self.nextUse[page] = nextUse
+        heapq.heappush(self.heap, (-nextUse, page))
+        if len(self.heap) > 2 * len(self.nextUse) + 64: # too many stale entries, rebuild
+            self.heap = [(-use, pg) for pg, use in self.nextUse.items()]
+            heapq.heapify(self.heap)
 
-    def _pop_tail(self):
-        res = self.tail.prev
-        self._remove_node(res)
-        return res
+    def getVictim(self): # pop the loaded page that is used furthest in the future
+        while self.heap:
+            negUse, page = heapq.heappop(self.heap)
+            if self.nextUse.get(page) == -negUse: # skip entries left over from older references
+                del self.nextUse[page]
+                return page
+        return None
 
-    def printList(self):
-        node = self.head.next
-        while node != self.tail:
-            print(node.key)
-            print("|")
-            node = node.next
+# PAGE REPLACEMENT ALGORITHMS
+class ReplacementPolicy:
+    """
+    What the Simulator needs from a page replacement algorithm. index is the position
+    of the current reference in the trace.
+    .on_access() is called for every reference to a page that is already in memory.
+    .on_fault() is called after a page has been loaded into frameNumber.
+    .choose_victim() is called on a fault for pageNumber when memory is full, it returns
+    the page to evict and forgets about it.
+    .keep() takes back a victim that mustn't be evicted after all (read-ahead never evicts
+    the page it reads ahead for), as the most recently loaded page.
+    .forget() drops every page in [first, stop) and any history of them, after the pages of
+    a whole address space were evicted behind the policy's back (a server client leaving).
+    .attach() hands the policy the page table, for the ones that use the PTEntry bits.
+    cleanScan > 0 makes fifo and lru evict the first clean page among their cleanScan
+    oldest instead of the oldest one, saving a write-back (enhanced-clock and wsclock
+    always prefer clean pages).
+    tlbFill says when the TLB gets the translation: 'fault' only when the page is loaded,
+    'access' on every reference (which also moves a hit to the back of the TLB queue).
+    The defaults keep what the original fifo, lru and opt loops did.
+    """
+    tlbFill = 'fault'
+    # True if calling on_access again for the page that was just accessed changes nothing,
+    # which lets --vectorize skip runs of references to the same page
+    collapsible = True
+    cleanScan = 0
+
+    def __init__(self, frames: int):
+        self.frames = frames
+        self.pt = None
+
+    def attach(self, pt: PageTable):
+        self.pt = pt
+    def on_access(self, pageNumber: int, frameNumber: int, index: int):
+        pass
+    def on_fault(self, pageNumber: int, frameNumber: int, index: int):
+        pass
+    def choose_victim(self, pageNumber: int, index: int):
+        raise NotImplementedError
+    def keep(self, pageNumber: int, frameNumber: int, index: int):
+        self.on_fault(pageNumber, frameNumber, index)
+    def forget(self, first: int, stop: int):
+        raise NotImplementedError
+
+class FIFOPolicy(ReplacementPolicy): # evict the page that was loaded first
+    tlbFill = 'access'
+
+    def __init__(self, frames: int):
+        super().__init__(frames)
+        self.queue = deque()
+    def on_fault(self, pageNumber: int, frameNumber: int, index: int):
+        self.queue.append(pageNumber)
+    def choose_victim(self, pageNumber: int, index: int):
+        if self.cleanScan:
+            isdirty = self.pt.isdirty
+            for i, page in enumerate(itertools.islice(self.queue, self.cleanScan)):
+                if not isdirty(page):
+                    del self.queue[i]
+                    return page
+        return self.queue.popleft()
+    def forget(self, first: int, stop: int):
+        self.queue = deque(page for page in self.queue if not first <= page < stop)
+
+class LRUPolicy(ReplacementPolicy): # evict the page that was used least recently
+    def __init__(self, frames: int):
+        super().__init__(frames)
+        self.order = OrderedDict() # least recently used first
+    def on_access(self, pageNumber: int, frameNumber: int, index: int):
+        self.order.move_to_end(pageNumber)
+    def on_fault(self, pageNumber: int, frameNumber: int, index: int):
+        self.order[pageNumber] = frameNumber
+    def choose_victim(self, pageNumber: int, index: int):
+        if self.cleanScan:
+            isdirty = self.pt.isdirty
+            for page in itertools.islice(self.order, self.cleanScan):
+                if not isdirty(page):
+                    del self.order[page]
+                    return page
+        return self.order.popitem(last=False)[0]
+    def forget(self, first: int, stop: int):
+        for page in [page for page in self.order if first <= page < stop]:
+            del self.order[page]
+
+class OPTPolicy(ReplacementPolicy): # evict the page used furthest in the future, needs the whole trace up front
+    def __init__(self, frames: int, pages: List[int]):
+        super().__init__(frames)
+        self.cache = OPTCache(pages)
+    def on_access(self, pageNumber: int, frameNumber: int, index: int):
+        self.cache.put(index, pageNumber)
+    def on_fault(self, pageNumber: int, frameNumber: int, index: int):
+        self.cache.put(index, pageNumber)
+    def choose_victim(self, pageNumber: int, index: int):
+        return self.cache.getVictim()
+
+class ClockPolicy(ReplacementPolicy):
+    """
+    CLOCK, a.k.a. second chance. The hand sweeps over the frames; a page whose referenced
+    bit is set gets it cleared and is skipped, the first page found with the bit clear is
+    evicted. Every bit is cleared at most once per set, so a fault is amortized O(1).
+    The Simulator hands out frame numbers from the whole of RAM, so with local replacement
+    (frames is the process's quota) the frame arrays have totalFrames slots and the hand
+    skips the frames that hold another process's pages.
+    """
+    def __init__(self, frames: int, totalFrames: int=None):
+        super().__init__(frames)
+        self.totalFrames = totalFrames or frames
+        self.pages = [None] * self.totalFrames # frame -> page number, None if it isn't ours
+        self.entries = [None] * self.totalFrames # frame -> PTEntry, holds the referenced and dirty bits
+        self.hand = 0
+    def on_access(self, pageNumber: int, frameNumber: int, index: int):
+        self.entries[frameNumber].referencedBit = 1
+    def on_fault(self, pageNumber: int, frameNumber: int, index: int):
+        self.pages[frameNumber] = pageNumber
+        self.entries[frameNumber] = entry = self.pt.entry(pageNumber)
+        entry.referencedBit = 1
+    def _advance(self):
+        self.hand = (self.hand + 1) % self.totalFrames
+    def _evict(self, frame: int): # the frame may go to another process next
+        victim = self.pages[frame]
+        self.pages[frame] = self.entries[frame] = None
+        return victim
+    def forget(self, first: int, stop: int):
+        for frame, page in enumerate(self.pages):
+            if page is not None and first <= page < stop:
+                self._evict(frame)
+    def choose_victim(self, pageNumber: int, index: int):
+        while True:
+            entry = self.entries[self.hand]
+            if entry is None: # not our frame
+                self._advance()
+            elif entry.referencedBit:
+                entry.referencedBit = 0 # second chance
+                self._advance()
+            else:
+                frame = self.hand
+                self._advance()
+                return self._evict(frame)
+
+class EnhancedClockPolicy(ClockPolicy):
+    """
+    Enhanced second chance: pages are ranked by (referenced, dirty) and the first page of
+    the lowest class is evicted, so clean pages go before dirty ones and a dirty page costs
+    a write back. One sweep looks for (0, 0) without touching anything, the next looks for
+    (0, 1) clearing referenced bits as it goes; after at most four sweeps something turns up.
+    """
+    def choose_victim(self, pageNumber: int, index: int):
+        while True:
+            for wantDirty in (0, 1):
+                for _ in range(self.totalFrames):
+                    entry = self.entries[self.hand]
+                    if entry is None: # not our frame
+                        self._advance()
+                        continue
+                    if not entry.referencedBit and entry.dirtyBit == wantDirty:
+                        frame = self.hand
+                        self._advance()
+                        return self._evict(frame)
+                    if wantDirty:
+                        entry.referencedBit = 0
+                    self._advance()
+
+class LFUPolicy(ReplacementPolicy):
+    """
+    Least frequently used, ties go to the least recently used page. Pages sit in one
+    OrderedDict per use count, so an access or eviction is O(1). Every agingPeriod
+    references all counts are halved, so pages that were hot a long time ago can still
+    be evicted (O(F) every agingPeriod references, O(1) amortized when it is >= F).
+    """
+    collapsible = False # every access counts
+
+    def __init__(self, frames: int, agingPeriod: int=None):
+        super().__init__(frames)
+        self.agingPeriod = agingPeriod or 8 * frames
+        self.nextAging = self.agingPeriod
+        self.counts = {} # page number -> use count
+        self.buckets = defaultdict(OrderedDict) # use count -> pages with that count, oldest first
+        self.minCount = 1
+    def _use(self, pageNumber: int, index: int):
+        count = self.counts[pageNumber]
+        bucket = self.buckets[count]
+        del bucket[pageNumber]
+        if not bucket:
+            del self.buckets[count]
+            if self.minCount == count:
+                self.minCount = count + 1
+        self.counts[pageNumber] = count + 1
+        self.buckets[count + 1][pageNumber] = None
+        if index >= self.nextAging:
+            self._age()
+            self.nextAging = index + self.agingPeriod
+    def _age(self): # halve every count, keeping the order inside each bucket
+        buckets = defaultdict(OrderedDict)
+        for count in sorted(self.buckets):
+            newCount = max(1, count >> 1)
+            for page in self.buckets[count]:
+                self.counts[page] = newCount
+                buckets[newCount][page] = None
+        self.buckets = buckets
+        self.minCount = min(buckets) if buckets else 1
+    def on_access(self, pageNumber: int, frameNumber: int, index: int):
+        self._use(pageNumber, index)
+    def on_fault(self, pageNumber: int, frameNumber: int, index: int):
+        self.counts[pageNumber] = 1
+        self.buckets[1][pageNumber] = None
+        self.minCount = 1
+        if index >= self.nextAging:
+            self._age()
+            self.nextAging = index + self.agingPeriod
+    def choose_victim(self, pageNumber: int, index: int):
+        while self.minCount not in self.buckets: # only after _age merged buckets
+            self.minCount += 1
+        bucket = self.buckets[self.minCount]
+        victim, _ = bucket.popitem(last=False)
+        if not bucket:
+            del self.buckets[self.minCount]
+        del self.counts[victim]
+        return victim
+    def forget(self, first: int, stop: int):
+        for page in [page for page in self.counts if first <= page < stop]:
+            count = self.counts.pop(page)
+            bucket = self.buckets[count]
+            del bucket[page]
+            if not bucket:
+                del self.buckets[count] # choose_victim() moves minCount on if it was this one
+        if not self.buckets:
+            self.minCount = 1
+
+class ARCPolicy(ReplacementPolicy):
+    """
+    Adaptive Replacement Cache (Megiddo & Modha). T1 holds pages seen once recently, T2
+    pages seen at least twice; B1 and B2 remember pages recently evicted from each. A
+    fault on a page in B1 means T1 was too small, so the target size p of T1 grows, a
+    fault on B2 shrinks it. All four lists are OrderedDicts (LRU first), everything is O(1).
+    """
+    def __init__(self, frames: int):
+        super().__init__(frames)
+        self.t1, self.t2 = OrderedDict(), OrderedDict() # in memory
+        self.b1, self.b2 = OrderedDict(), OrderedDict() # ghosts, page numbers only
+        self.p = 0 # target size of T1
+    def on_access(self, pageNumber: int, frameNumber: int, index: int):
+        if pageNumber in self.t1:
+            del self.t1[pageNumber]
+        self.t2[pageNumber] = None
+        self.t2.move_to_end(pageNumber)
+    def on_fault(self, pageNumber: int, frameNumber: int, index: int):
+        if pageNumber in self.b1:
+            del self.b1[pageNumber]
+            self.t2[pageNumber] = None
+        elif pageNumber in self.b2:
+            del self.b2[pageNumber]
+            self.t2[pageNumber] = None
+        else:
+            self.t1[pageNumber] = None
+    def keep(self, pageNumber: int, frameNumber: int, index: int): # back to the list it was evicted from
+        if pageNumber in self.b2:
+            del self.b2[pageNumber]
+            self.t2[pageNumber] = None
+        else:
+            self.b1.pop(pageNumber, None)
+            self.t1[pageNumber] = None
+    def forget(self, first: int, stop: int):
+        for pages in (self.t1, self.t2, self.b1, self.b2):
+            for page in [page for page in pages if first <= page < stop]:
+                del pages[page]
+    def _replace(self, pageNumber: int):
+        if self.t1 and (len(self.t1) > self.p or (pageNumber in self.b2 and len(self.t1) == self.p)):
+            victim, _ = self.t1.popitem(last=False)
+            self.b1[victim] = None
+        else:
+            victim, _ = self.t2.popitem(last=False)
+            self.b2[victim] = None
+        return victim
+    def choose_victim(self, pageNumber: int, index: int):
+        c = self.frames
+        if pageNumber in self.b1:
+            self.p = min(c, self.p + max(len(self.b2) // len(self.b1), 1))
+            return self._replace(pageNumber)
+        if pageNumber in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) // len(self.b2), 1))
+            return self._replace(pageNumber)
+        if len(self.t1) + len(self.b1) >= c:
+            if len(self.t1) < c:
+                self.b1.popitem(last=False)
+                return self._replace(pageNumber)
+            return self.t1.popitem(last=False)[0] # B1 is empty, drop the LRU page of T1 for good
+        if len(self.t1) + len(self.t2) + len(self.b1) + len(self.b2) >= 2 * c:
+            self.b2.popitem(last=False)
+        return self._replace(pageNumber)
+
+class TwoQPolicy(ReplacementPolicy):
+    """
+    Full 2Q (Johnson & Shasha). New pages go into the FIFO A1in; pages evicted from it are
+    remembered in the ghost FIFO A1out, and only a page that faults again while in A1out is
+    promoted to the LRU list Am. One-time scans therefore never push out the hot pages in Am.
+    A1in gets a quarter of the frames and A1out remembers half as many pages as there are frames.
+    """
+    def __init__(self, frames: int):
+        super().__init__(frames)
+        self.kin = max(1, frames // 4)
+        self.kout = max(1, frames // 2)
+        self.a1in = OrderedDict() # oldest first
+        self.a1out = OrderedDict() # ghosts, oldest first
+        self.am = OrderedDict() # least recently used first
+    def on_access(self, pageNumber: int, frameNumber: int, index: int):
+        if pageNumber in self.am:
+            self.am.move_to_end(pageNumber)
+    def on_fault(self, pageNumber: int, frameNumber: int, index: int):
+        if pageNumber in self.a1out:
+            del self.a1out[pageNumber]
+            self.am[pageNumber] = None
+        else:
+            self.a1in[pageNumber] = None
+    def keep(self, pageNumber: int, frameNumber: int, index: int): # back to the list it was evicted from
+        if pageNumber in self.a1out:
+            del self.a1out[pageNumber]
+            self.a1in[pageNumber] = None
+        else:
+            self.am[pageNumber] = None
+    def forget(self, first: int, stop: int):
+        for pages in (self.a1in, self.a1out, self.am):
+            for page in [page for page in pages if first <= page < stop]:
+                del pages[page]
+    def choose_victim(self, pageNumber: int, index: int):
+        if len(self.a1in) > self.kin or not self.am:
+            victim, _ = self.a1in.popitem(last=False)
+            self.a1out[victim] = None
+            if len(self.a1out) > self.kout:
+                self.a1out.popitem(last=False)
+            return victim
+        return self.am.popitem(last=False)[0]
+
+class WSClockPolicy(ClockPolicy):
+    """
+    WSClock (Carr & Hennessy), the working set algorithm on a clock. Virtual time is the
+    trace position. Sweeping from the hand, a referenced page has its bit cleared and its
+    last use set to now; a clean page that wasn't used in the last window references is out
+    of the working set and gets evicted. Dirty old pages are passed over in favour of clean
+    ones. If a whole sweep finds nothing, the page unused for longest is evicted.
+    """
+    collapsible = False # virtual time has to count every reference
+
+    def __init__(self, frames: int, window: int=None, totalFrames: int=None):
+        super().__init__(frames, totalFrames)
+        self.window = window or 4 * frames
+        self.lastUse = [0] * self.totalFrames # frame -> virtual time of last use
+    def on_fault(self, pageNumber: int, frameNumber: int, index: int):
+        super().on_fault(pageNumber, frameNumber, index)
+        self.lastUse[frameNumber] = index
+    def choose_victim(self, pageNumber: int, index: int):
+        oldest = None
+        for _ in range(self.totalFrames):
+            frame = self.hand
+            entry = self.entries[frame]
+            if entry is None: # not our frame
+                self._advance()
+                continue
+            if entry.referencedBit:
+                entry.referencedBit = 0
+                self.lastUse[frame] = index
+            elif index - self.lastUse[frame] > self.window and not entry.dirtyBit:
+                self._advance()
+                return self._evict(frame)
+            if oldest is None or self.lastUse[frame] < self.lastUse[oldest]:
+                oldest = frame
+            self._advance()
+        self.hand = (oldest + 1) % self.totalFrames
+        return self._evict(oldest)
 
-    def getLRU(self): # Get Get LRU from the cache
-        node = self.tail.prev
-        if not node:
-            return -1
-        # self._move_to_head(node)
-        return node
-   
-
-    def put(self, key, value): # put a new node in the cache, evict is necessary
-        node = self.hashmap.get(key)
-        if not node:
-            new_node = ListNode(key, value)
-            self.hashmap[key] = new_node
-            self._add_node(new_node)
-            
-            if len(self.hashmap) > self.capacity: # remove the node
-                tail = self._pop_tail()
-                del self.hashmap[tail.key]
+POLICIES = {'fifo': FIFOPolicy, 'lru': LRUPolicy, 'opt': OPTPolicy,
+            'clock': ClockPolicy, 'second-chance': ClockPolicy, 'enhanced-clock': EnhancedClockPolicy,
+            'lfu': LFUPolicy, 'arc': ARCPolicy, '2q': TwoQPolicy, 'wsclock': WSClockPolicy}
+
+def makePolicy(name: str, frames: int, pages: List[int]=None, lfuAging: int=None, wsWindow: int=None,
+               cleanScan: int=0, totalFrames: int=None):
+    """
+    Build the policy for a pra name. OPT needs the page numbers of the whole trace. With local
+    replacement frames is the process's quota and totalFrames the size of RAM.
+    """
+    if name == 'opt':
+        policy = OPTPolicy(frames, pages)
+    elif name == 'lfu':
+        policy = LFUPolicy(frames, agingPeriod=lfuAging)
+    elif name == 'wsclock':
+        policy = WSClockPolicy(frames, window=wsWindow, totalFrames=totalFrames)
+    elif issubclass(POLICIES[name], ClockPolicy):
+        policy = POLICIES[name](frames, totalFrames=totalFrames)
+    else:
+        policy = POLICIES[name](frames)
+    policy.cleanScan = cleanScan
+    return policy
+
+# PREFETCHERS (--prefetch)
+class Prefetcher:
+    """
+    Read-ahead on page faults. The Simulator loads the pages a prefetcher returns into free
+    frames (evicting through the replacement policy when memory is full) without putting them
+    in the TLB, and keeps track of them until they are used or evicted.
+    .on_fault() is called after a demand fault and returns the pages to read ahead.
+    .on_hit() is called the first time a prefetched page is used, it can return more pages.
+    .on_waste() is called when a prefetched page is evicted without being used.
+    .forget() drops any history of the pages in [first, stop), like ReplacementPolicy.forget().
+    """
+    def on_fault(self, pageNumber: int, index: int):
+        return ()
+    def on_hit(self, pageNumber: int, index: int):
+        return ()
+    def on_waste(self, pageNumber: int):
+        pass
+    def forget(self, first: int, stop: int):
+        pass
+
+class SequentialPrefetcher(Prefetcher):
+    """
+    Adaptive read-ahead, like Linux: a fault that continues the previous one starts a window
+    after it, and using the first page of a window reads the next window ahead. The window
+    doubles while the stream keeps going (up to maxWindow), starts over at minWindow on a
+    random fault and halves when a prefetched page is evicted unused.
+    """
+    def __init__(self, maxWindow: int=32, minWindow: int=2):
+        self.minWindow = minWindow
+        self.maxWindow = max(maxWindow, minWindow)
+        self.window = minWindow
+        self.lastFault = None
+        self.expected = None # first page after the last window
+        self.trigger = None # using this page reads the next window ahead
+    def _ahead(self, start: int):
+        pages = range(start, start + self.window)
+        self.trigger = start
+        self.expected = start + self.window
+        return pages
+    def on_fault(self, pageNumber: int, index: int):
+        if self.lastFault is not None and pageNumber in (self.lastFault + 1, self.expected):
+            self.window = min(self.window * 2, self.maxWindow)
         else:
-            node.value = value
-            self._move_to_head(node)
+            self.window = self.minWindow
+        self.lastFault = pageNumber
+        return self._ahead(pageNumber + 1)
+    def on_hit(self, pageNumber: int, index: int):
+        if pageNumber != self.trigger:
+            return ()
+        self.window = min(self.window * 2, self.maxWindow)
+        return self._ahead(self.expected)
+    def on_waste(self, pageNumber: int):
+        self.window = max(self.window // 2, self.minWindow)
+
+class StridePrefetcher(Prefetcher):
+    """
+    Watches the stream of faulting and prefetch-hit pages for a constant stride. Once the same
+    stride shows up twice in a row it prefetches degree pages ahead along it, then keeps one
+    new page degree strides ahead for every page of the stream that gets used.
+    """
+    def __init__(self, degree: int=4):
+        self.degree = degree
+        self.last = None
+        self.stride = 0
+        self.confident = False
+    def _observe(self, pageNumber: int):
+        stride = pageNumber - self.last if self.last is not None else 0
+        self.confident = stride != 0 and stride == self.stride
+        self.stride = stride
+        self.last = pageNumber
+    def on_fault(self, pageNumber: int, index: int):
+        self._observe(pageNumber)
+        if not self.confident:
+            return ()
+        return [pageNumber + self.stride * k for k in range(1, self.degree + 1)]
+    def on_hit(self, pageNumber: int, index: int):
+        self._observe(pageNumber)
+        if not self.confident:
+            return ()
+        return (pageNumber + self.stride * self.degree,)
+
+class MarkovPrefetcher(Prefetcher):
+    """
+    History based: remembers which page followed which in the stream of faulting and
+    prefetch-hit pages, and on a fault prefetches the width pages that most often came
+    next after the faulting one.
+    """
+    def __init__(self, width: int=2):
+        self.width = width
+        self.successors = {} # page -> next page -> times seen
+        self.last = None
+    def _observe(self, pageNumber: int):
+        if self.last is not None:
+            following = self.successors.setdefault(self.last, {})
+            following[pageNumber] = following.get(pageNumber, 0) + 1
+        self.last = pageNumber
+    def on_fault(self, pageNumber: int, index: int):
+        self._observe(pageNumber)
+        following = self.successors.get(pageNumber)
+        if not following:
+            return ()
+        return heapq.nlargest(self.width, following, key=following.get)
+    def on_hit(self, pageNumber: int, index: int):
+        self._observe(pageNumber)
+        return ()
+    def forget(self, first: int, stop: int):
+        for page in list(self.successors):
+            if first <= page < stop:
+                del self.successors[page]
+            else:
+                following = self.successors[page]
+                for successor in [successor for successor in following if first <= successor < stop]:
+                    del following[successor]
+        if self.last is not None and first <= self.last < stop:
+            self.last = None
+
+PREFETCHERS = {'sequential': SequentialPrefetcher, 'stride': StridePrefetcher, 'markov': MarkovPrefetcher}
+
+def makePrefetcher(name: str, depth: int=None):
+    """ Build a prefetcher, depth is the max window (sequential), degree (stride) or width (markov). """
+    if name is None:
+        return None
+    return PREFETCHERS[name]() if depth is None else PREFETCHERS[name](depth)
+
+# OBJECTS FOR THE SWEEP (--sweep) IMPLEMENTATION:
+class FenwickTree: # binary indexed tree over trace positions, used for LRU stack distances
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = array('q', [0]) * (size + 1)
+
+    def add(self, index: int, delta: int):
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int): # sum of positions 0..index-1
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+def lruStackDistances(pages: List[int], maxFrames: int):
+    """
+    Mattson's stack algorithm for LRU. The stack distance of a reference is the number of
+    distinct pages touched since the last reference to the same page, plus one. A reference
+    faults with F frames exactly when its distance is larger than F, so one pass gives the
+    fault count for every frame count. Positions holding the latest reference of each page
+    are marked in a Fenwick tree, which makes each distance an O(log N) range count.
+    Returns hist where hist[d] is the number of references with distance d (1 <= d <= maxFrames).
+    """
+    hist = [0] * (maxFrames + 1)
+    marks = FenwickTree(len(pages))
+    last = {} # page number -> position of its latest reference
+    for i, page in enumerate(pages):
+        j = last.get(page)
+        if j is not None: # cold misses never hit, whatever the frame count
+            distance = marks.prefix(i) - marks.prefix(j + 1) + 1
+            if distance <= maxFrames:
+                hist[distance] += 1
+            marks.add(j, -1)
+        marks.add(i, 1)
+        last[page] = i
+    return hist
+
+def optStackDistances(pages: List[int], maxFrames: int):
+    """
+    Mattson's stack algorithm for OPT. The top F pages of the stack are exactly what OPT keeps
+    with F frames. On each reference the page moves to the top and the pages above its old
+    position are re-sorted on the way down: at every level the page used sooner stays and the
+    one used later is carried further down. Pages never move up unless referenced, so the stack
+    is cut off at maxFrames. Returns the same histogram as lruStackDistances.
+    """
+    hist = [0] * (maxFrames + 1)
+    nextPos = OPTCache.next_positions(pages)
+    nextUse = {} # page number -> position of its next reference
+    stack = [] # page numbers, top of the stack first
+    for i, page in enumerate(pages):
+        try:
+            k = stack.index(page)
+            hist[k + 1] += 1
+        except ValueError:
+            k = None
+        nextUse[page] = nextPos[i]
+        if k == 0:
+            continue
+        if not stack:
+            stack.append(page)
+            continue
+        carry = stack[0]
+        stack[0] = page
+        for j in range(1, len(stack) if k is None else k):
+            if nextUse[stack[j]] > nextUse[carry]: # stack[j] is used later, push it down
+                stack[j], carry = carry, stack[j]
+        if k is not None:
+            stack[k] = carry
+        elif len(stack) < maxFrames:
+            stack.append(carry)
+        else: # fell off the bottom, can't matter for maxFrames frames or fewer
+            del nextUse[carry]
+    return hist
+
+def printSweep(hist: List[int], numAddr: int, output):
+    """
+    Print the fault curve as CSV: page faults with F frames are all the references
+    whose stack distance is larger than F.
+    """
+    output.line('Frames,Page Faults,Page Fault Rate')
+    hits = 0
+    for frames in range(1, len(hist)):
+        hits += hist[frames]
+        page_faults = numAddr - hits
+        output.line(f'{frames},{page_faults},{(page_faults/numAddr):.6f}')
+
+# TRACE INPUT
+# Binary traces are a 16 byte header (TRACE_MAGIC, then the address width in bytes as a
+# little endian uint32, then 4 reserved bytes) followed by packed little endian unsigned
+# addresses, so numpy.fromfile(path, dtype='<u4' or '<u8', offset=16) reads them directly.
+TRACE_MAGIC = b'MEMTRACE'
+TRACE_HEADER = struct.Struct('<8sII') # magic, address width in bytes, flags
+TRACE_WRITES = 1 # flag: the top bit of each record marks a write
+TRACE_CHUNK = 1 << 16 # addresses per chunk
+TEXT_CHUNK_BYTES = 1 << 20 # how much text to read at a time
 
-# print helper function so that we have less code
-def printInfo(pt, memory, address, p, d, frame_number):
-    frame_data = memory.getitem(pt.pageTable[p].frameNumber) # get frame data from memory
-    signed_byte_data = int.from_bytes([frame_data[d]], byteorder='little', signed=True)
-    frame_data_hex = ''.join(format(b, '02x') for b in frame_data).upper()
-    print(f'{str(address)}, {signed_byte_data}, {str(frame_number)}, {frame_data_hex}')  
+def openTrace(filename: str, mode: str='rb'): # transparently decompresses .gz and .xz traces
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode)
+    if filename.endswith('.xz'):
+        return lzma.open(filename, mode)
+    return open(filename, mode)
+
+def traceFormat(filename: str): # 'bin' if the file starts with the binary header, otherwise 'dec'
+    with openTrace(filename) as f:
+        return 'bin' if f.read(len(TRACE_MAGIC)) == TRACE_MAGIC else 'dec'
+
+def readTrace(filename: str, fmt: str='auto', chunkSize: int=TRACE_CHUNK, start: int=0):
+    """
+    Generator over a trace file that yields lists of up to chunkSize addresses.
+    fmt is 'dec' (one decimal address per line), 'hex' (one hex address per line,
+    0x prefix optional), 'bin' (the binary format above) or 'auto' to tell 'bin'
+    apart from 'dec' by the header. Any of them can be gzip or xz compressed.
+    Like the original readline() loop, a text trace ends at the first blank line.
+    A text line can start with R or W to mark a read or a write ('W 4660'), in binary traces
+    with the TRACE_WRITES flag the top bit of a record marks a write. A write to address a
+    is yielded as ~a, which is negative, plain addresses are reads.
+    The first start references are skipped: binary traces seek past them, text traces only
+    split their lines.
+    """
+    if fmt == 'auto':
+        fmt = traceFormat(filename)
+    if fmt == 'bin':
+        yield from _readBinaryTrace(filename, chunkSize, start=start)
+        return
+    base = 16 if fmt == 'hex' else 10
+    with openTrace(filename, 'rt') as f:
+        if start:
+            next(itertools.islice(f, start, start), None)
+        while lines := f.readlines(TEXT_CHUNK_BYTES):
+            try:
+                yield [int(line, base) for line in lines]
+            except ValueError: # a blank line (end of the trace), R/W records or garbage
+                chunk = []
+                for line in lines:
+                    line = line.strip()
+                    if not line:
+                        yield chunk
+                        return
+                    kind = line[0]
+                    if kind in 'Ww':
+                        chunk.append(~int(line[1:], base))
+                    elif kind in 'Rr':
+                        chunk.append(int(line[1:], base))
+                    else:
+                        chunk.append(int(line, base))
+                yield chunk
+
+def _decodeWrites(chunks, width: int): # top bit set -> write, yielded as ~address
+    top = 1 << (width * 8 - 1)
+    for chunk in chunks:
+        yield [record if record < top else ~(record ^ top) for record in chunk]
+
+def _readBinaryTrace(filename: str, chunkSize: int, raw: bool=False, start: int=0): # raw leaves the write bit in
+    with openTrace(filename) as f:
+        magic, width, flags = TRACE_HEADER.unpack(f.read(TRACE_HEADER.size))
+        if magic != TRACE_MAGIC or width not in (4, 8):
+            raise ValueError(f'{filename} is not a binary trace')
+        if flags & TRACE_WRITES and not raw:
+            yield from _decodeWrites(_readBinaryTrace(filename, chunkSize, raw=True, start=start), width)
+            return
+        typecode = 'I' if width == 4 else 'Q'
+        swap = sys.byteorder != 'little'
+        if isinstance(f, gzip.GzipFile) or isinstance(f, lzma.LZMAFile): # can't mmap, stream it
+            f.seek(start * width, os.SEEK_CUR)
+            while data := f.read(chunkSize * width):
+                chunk = array(typecode, data)
+                if swap:
+                    chunk.byteswap()
+                yield chunk.tolist()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            count = (len(mm) - TRACE_HEADER.size) // width
+            # every view of the map has to be released before it can be closed
+            with memoryview(mm) as whole, whole[TRACE_HEADER.size:TRACE_HEADER.size + count * width] as body, \
+                    body.cast(typecode) as view:
+                for first in range(start, count, chunkSize):
+                    with view[first:first + chunkSize] as chunk:
+                        if swap:
+                            swapped = array(typecode, chunk)
+                            swapped.byteswap()
+                            yield swapped.tolist()
+                        else:
+                            yield chunk.tolist()
+
+def outsideAddress(chunk, addressBits: int): # the first address of the chunk outside addressBits, or None
+    limit = 1 << addressBits
+    if chunk and (min(chunk) < -limit or max(chunk) >= limit): # ~address for writes
+        return next(a if a >= 0 else ~a for a in chunk if not -limit <= a < limit)
+    return None
+
+def boundedChunks(chunks, addressBits: int): # the chunks, ValueError at the first address outside addressBits
+    for chunk in chunks:
+        address = outsideAddress(chunk, addressBits)
+        if address is not None:
+            raise ValueError(f'address {address} is outside the {addressBits} bit address space')
+        yield chunk
+
+def iterTrace(filename: str, fmt: str='auto', start: int=0, addressBits: int=None): # one address at a time
+    chunks = readTrace(filename, fmt, start=start)
+    if addressBits is not None:
+        chunks = boundedChunks(chunks, addressBits)
+    return itertools.chain.from_iterable(chunks)
+
+def tracePages(trace, pageSize: int): # page number of every reference, reads and writes alike
+    return [(address if address >= 0 else ~address) // pageSize for address in trace]
+
+def writeBinaryTrace(filename: str, chunks, width: int=4, writes: bool=False):
+    """
+    Write chunks of addresses as a binary trace (gzip or xz compressed if the name says so).
+    With writes the header gets the TRACE_WRITES flag and writes (~address) are stored with
+    the top bit set, which leaves one bit less for the address.
+    Returns the number of addresses written.
+    """
+    typecode = 'I' if width == 4 else 'Q'
+    top = 1 << (width * 8 - 1)
+    count = 0
+    with openTrace(filename, 'wb') as f:
+        f.write(TRACE_HEADER.pack(TRACE_MAGIC, width, TRACE_WRITES if writes else 0))
+        for chunk in chunks:
+            try:
+                if writes:
+                    if any(address >= top or ~address >= top for address in chunk):
+                        raise OverflowError
+                    chunk = [address if address >= 0 else ~address | top for address in chunk]
+                data = array(typecode, chunk)
+            except OverflowError:
+                if not writes and any(address < 0 for address in chunk):
+                    raise ValueError('the trace has writes') from None
+                raise ValueError(f'an address in the trace does not fit in {width * 8} bits, use --convert-width 64') from None
+            if sys.byteorder != 'little':
+                data.byteswap()
+            f.write(data.tobytes())
+            count += len(data)
+    return count
+
+def convertTrace(source: str, filename: str, fmt: str='auto', widths=(4, 8)):
+    """
+    writeBinaryTrace() with the first width, without and then with the writes flag, that holds
+    the trace. The source is read again for every retry. Returns the number of addresses.
+    """
+    for writes in (False, True):
+        for width in widths:
+            try:
+                return writeBinaryTrace(filename, readTrace(source, fmt), width=width, writes=writes)
+            except ValueError as e:
+                error = e
+    raise error
+
+# OUTPUT
+class OutputWriter:
+    """
+    Everything the simulator prints goes through here. Lines are collected as bytes and
+    written to stdout (or filename) in big batches instead of one print() per reference.
+    .reference() writes the line for one translated address, depending on level:
+        'full'   - address, signed byte value, frame number, hex dump of the frame
+        'nodump' - address, signed byte value, frame number
+        'stats'  - nothing, only the statistics at the end are written
+    The hex dump is cached per frame by RAM, so it is only built once per page-in.
+    With append an existing filename is added to instead of overwritten.
+    """
+    def __init__(self, memory: RAM=None, level: str='full', filename: str=None, batch: int=4096,
+                 append: bool=False):
+        self.memory = memory
+        self.level = level
+        self.file = open(filename, 'ab' if append else 'wb') if filename else sys.stdout.buffer
+        self.batch = batch
+        self.pending = []
+        if level == 'full':
+            self.reference = self._full
+        elif level == 'nodump':
+            self.reference = self._nodump
+        else:
+            self.reference = self._skip
+
+    def _full(self, address: int, frameNumber: int, offset: int):
+        value = self.memory.ram[frameNumber * self.memory.frameSize + offset]
+        if value > 127: # signed byte
+            value -= 256
+        self.pending.append(b'%d, %d, %d, %s\n' % (address, value, frameNumber, self.memory.gethex(frameNumber)))
+        if len(self.pending) >= self.batch:
+            self.flush()
+    def _nodump(self, address: int, frameNumber: int, offset: int):
+        value = self.memory.ram[frameNumber * self.memory.frameSize + offset]
+        if value > 127:
+            value -= 256
+        self.pending.append(b'%d, %d, %d\n' % (address, value, frameNumber))
+        if len(self.pending) >= self.batch:
+            self.flush()
+    def _skip(self, address: int, frameNumber: int, offset: int):
+        pass
+    def line(self, text: str): # anything else, like the statistics
+        self.pending.append(text.encode() + b'\n')
+        if len(self.pending) >= self.batch:
+            self.flush()
+    def flush(self):
+        self.file.write(b''.join(self.pending))
+        self.pending.clear()
+        self.file.flush()
+    def close(self):
+        self.flush()
+        if self.file is not sys.stdout.buffer:
+            self.file.close()
+
+# SIMULATION
+class Simulator:
+    """
+    Translates a trace one address at a time, the same loop for every replacement policy:
+    TLB, then page table, then on a page fault evict a victim if memory is full and load
+    the page from disk. The counters carry over between calls to .run(), so a trace can be
+    fed in pieces.
+    A write (~address in the trace) sets the page's dirty bit. Evicting a dirty page writes
+    it back through disk.writepage() first.
+    With a prefetcher, the pages it asks for are read ahead after each demand fault, once the
+    faulting reference is done. A prefetched page isn't put in the TLB, so its first use is
+    always a TLB miss and a page table hit, and only that path checks for prefetch hits.
+    """
+    def __init__(self, pt: PageTable, tlb: TLB, memory: RAM, disk: Disk, policy: ReplacementPolicy,
+                 output: OutputWriter, pageSize: int=PAGE_SIZE, tlbFill: str=None, prefetcher: Prefetcher=None):
+        self.pt = pt
+        self.tlb = tlb
+        self.memory = memory
+        self.disk = disk
+        self.policy = policy
+        self.output = output
+        self.pageSize = pageSize
+        self.tlbFill = tlbFill or policy.tlbFill
+        policy.attach(pt)
+        self.position = 0 # references handed to the policy so far, the index it sees
+        # statistics to keep track of
+        self.numAddr = 0
+        self.pageFaults = 0
+        self.tlbHits = 0
+        self.tlbMisses = 0
+        self.writes = 0
+        self.writeBacks = 0
+        self.prefetcher = prefetcher
+        self.prefetched = set() # prefetched pages that haven't been used yet
+        self.prefetches = 0 # pages read ahead
+        self.prefetchHits = 0 # ... that were used
+        self.prefetchWasted = 0 # ... that were evicted without being used
+
+    def __getstate__(self): # everything but the open files, see saveCheckpoint()
+        state = self.__dict__.copy()
+        del state['disk'], state['output']
+        return state
+
+    def evict(self, victim: int): # evict a page outside of the hot loop
+        frameNumber = self.pt.getframe(victim)
+        if self.pt.isdirty(victim):
+            self.disk.writepage(victim, self.memory.getitem(frameNumber))
+            self.writeBacks += 1
+        self.memory.deleteitem(frameNumber)
+        self.tlb.deleteitem(victim)
+        self.pt.unmap(victim)
+        if victim in self.prefetched:
+            self.prefetched.discard(victim)
+            self.prefetchWasted += 1
+            self.prefetcher.on_waste(victim)
+    def forget(self, first: int, stop: int):
+        """
+        Throw away pages [first, stop), an address space nobody uses any more: resident pages
+        are dropped without a write-back, the TLB, the policy, the prefetcher and the overlay
+        forget them, so the pages read from the backing store again as if they were new.
+        """
+        pt = self.pt
+        for page in [page for page in pt.frameToPage.values() if first <= page < stop]:
+            self.memory.deleteitem(pt.getframe(page))
+            self.tlb.deleteitem(page)
+            pt.unmap(page)
+            self.prefetched.discard(page)
+        self.policy.forget(first, stop)
+        if self.prefetcher is not None:
+            self.prefetcher.forget(first, stop)
+        self.disk.discard(first, stop)
+    def readAhead(self, pageNumber: int, pages, index: int):
+        """
+        Prefetch pages in pageNumber's address space that aren't loaded, at most memory size - 1.
+        Stops early rather than evict pageNumber itself, the page that just faulted.
+        """
+        pt, memory, policy, numPages = self.pt, self.memory, self.policy, self.disk.numPages
+        space = pageNumber // numPages
+        budget = memory.size - 1
+        for page in pages:
+            if budget <= 0:
+                break
+            if page < 0 or page // numPages != space or pt.contains(page):
+                continue
+            if memory.free == 0:
+                victim = policy.choose_victim(page, index)
+                if victim == pageNumber: # everything else is worth keeping more than the read-ahead
+                    policy.keep(victim, pt.getframe(victim), index)
+                    break
+                self.evict(victim)
+            frameNumber = memory.setitem(self.disk.getpage(page))
+            pt.map(page, frameNumber)
+            policy.on_fault(page, frameNumber, index)
+            self.prefetched.add(page)
+            self.prefetches += 1
+            budget -= 1
+
+    def run(self, trace):
+        # everything the loop touches is a local, attribute lookups add up over millions of references
+        pt, tlb, memory, disk, policy = self.pt, self.tlb, self.memory, self.disk, self.policy
+        tlbLookup, tlbAdd, ptLookup, setDirty = tlb.lookup, tlb.add, pt.lookup, pt.setdirty
+        onAccess, onFault, chooseVictim = policy.on_access, policy.on_fault, policy.choose_victim
+        reference = self.output.reference
+        shift = self.pageSize.bit_length() - 1 # page size is a power of two
+        mask = self.pageSize - 1
+        fillOnAccess = self.tlbFill == 'access'
+        index = start = self.position
+        pageFaults = tlbHits = tlbMisses = writes = writeBacks = 0
+        anyWrites = self.writes > 0 # no dirty pages to check for until the first write
+        prefetcher, prefetched, readAhead = self.prefetcher, self.prefetched, self.readAhead
+        ahead = None # pages to read ahead once the current reference is done
+        try:
+            for address in trace:
+                write = address < 0
+                if write:
+                    address = ~address
+                # break down into page number and offset
+                p = address >> shift
+                d = address & mask
+                frame_number = tlbLookup(p) # check tlb
+                if frame_number is not None:
+                    tlbHits += 1
+                    if fillOnAccess:
+                        tlbAdd(p, frame_number)
+                    onAccess(p, frame_number, index)
+                else:
+                    tlbMisses += 1
+                    frame_number = ptLookup(p) # page walk
+                    if frame_number is not None: # no page fault
+                        if fillOnAccess:
+                            tlbAdd(p, frame_number)
+                        onAccess(p, frame_number, index)
+                        if prefetched and p in prefetched: # first use of a prefetched page
+                            prefetched.discard(p)
+                            self.prefetchHits += 1
+                            ahead = prefetcher.on_hit(p, index)
+                    else: # page fault
+                        pageFaults += 1
+                        if memory.free == 0: # need to invoke page replacement algorithm
+                            victim = chooseVictim(p, index)
+                            victimFrame = pt.getframe(victim)
+                            if anyWrites and pt.isdirty(victim): # write it back before the frame is reused
+                                disk.writepage(victim, memory.getitem(victimFrame))
+                                writeBacks += 1
+                            if prefetched and victim in prefetched:
+                                prefetched.discard(victim)
+                                self.prefetchWasted += 1
+                                prefetcher.on_waste(victim)
+                            # Delete the frame from memory & TLB and update the page table to reflect deletion
+                            memory.deleteitem(victimFrame)
+                            tlb.deleteitem(victim)
+                            pt.unmap(victim)
+                        frame_number = memory.setitem(disk.getpage(p)) # write frame data to memory
+                        pt.map(p, frame_number)
+                        tlbAdd(p, frame_number)
+                        onFault(p, frame_number, index)
+                        if prefetcher is not None:
+                            ahead = prefetcher.on_fault(p, index)
+                if write:
+                    setDirty(p)
+                    writes += 1
+                    anyWrites = True
+                reference(address, frame_number, d)
+                if ahead:
+                    readAhead(p, ahead, index)
+                    ahead = None
+                index += 1
+        finally:
+            self.numAddr += index - start
+            self.position = index
+            self.pageFaults += pageFaults
+            self.tlbHits += tlbHits
+            self.tlbMisses += tlbMisses
+            self.writes += writes
+            self.writeBacks += writeBacks
+    def printStats(self, walks: bool=False):
+        output, num_addr = self.output, self.numAddr
+        output.line(f'Number of Translated Addresses = {num_addr}')
+        output.line(f'Page Faults = {self.pageFaults}')
+        output.line(f'Page Fault Rate = {(self.pageFaults/num_addr):.3f}')
+        output.line(f'TLB Hits = {self.tlbHits}')
+        output.line(f'TLB Misses = {self.tlbMisses}')
+        output.line(f'TLB Hit Rate = {(self.tlbHits/num_addr):.3f}')
+        if self.prefetcher is not None:
+            output.line(f'Prefetches = {self.prefetches}')
+            output.line(f'Prefetch Hits = {self.prefetchHits}')
+            output.line(f'Wasted Prefetches = {self.prefetchWasted}')
+            output.line(f'Prefetch Accuracy = {(self.prefetchHits / self.prefetches if self.prefetches else 0.0):.3f}')
+        if self.writes: # read only traces keep the original report
+            pageIns = self.pageFaults + self.prefetches
+            output.line(f'Writes = {self.writes}')
+            output.line(f'Page Ins = {pageIns}, {pageIns * self.pageSize} bytes')
+            output.line(f'Write Backs = {self.writeBacks}, {self.writeBacks * self.pageSize} bytes')
+        if walks:
+            output.line(f'Page Walks = {self.pt.walks}')
+            output.line(f'Average Page Walk Cost = {self.pt.walkCost():.3f}')
+            output.line(f'Page Walk Accesses Per Level = {", ".join(str(n) for n in self.pt.levelAccesses)}')
+
+# MULTIPLE PROCESSES (--process)
+class MultiSimulator:
+    """
+    Several processes, one trace each, sharing physical memory, the TLB and the backing store.
+    Process pid's addresses are tagged with its address space id above the addressBits of a
+    single space before they reach the Simulator, so one page table, one TLB and one Simulator
+    hold every address space and each quantum runs through the same hot loop as a single
+    process. The tags make the TLB entries ASID-tagged, with tlbTags='flush' the TLB is
+    emptied on every context switch instead.
+    The scheduler runs quantum references of one process at a time, 'round-robin' or
+    'random' (seeded). When .run() gets policies (one per process) replacement is local:
+    sim.memory has to be a PartitionedRAM and a process only evicts its own pages. Otherwise
+    sim.policy picks victims from every process (global replacement).
+    A process counts as thrashing in a quantum when its page fault rate over its last
+    thrashWindow quanta is above thrashThreshold.
+    """
+    def __init__(self, names: List[str], addressBits: int, quantum: int=1000, scheduler: str='round-robin',
+                 tlbTags: str='asid', seed: int=0, thrashThreshold: float=0.5, thrashWindow: int=8):
+        self.sim = None
+        self.policies = None
+        self.names = names
+        self.addressBits = addressBits
+        self.tags = [pid << addressBits for pid in range(len(names))]
+        self.quantum = quantum
+        self.scheduler = scheduler
+        self.tlbTags = tlbTags
+        self.seed = seed
+        self.thrashThreshold = thrashThreshold
+        self.current = None
+        self.contextSwitches = 0
+        self.refs = [0] * len(names)
+        self.faults = [0] * len(names)
+        self.tlbHits = [0] * len(names)
+        self.quanta = [0] * len(names)
+        self.thrashing = [0] * len(names) # quanta spent thrashing
+        self.windows = [deque(maxlen=thrashWindow) for _ in names] # (refs, faults) of recent quanta
+
+    def slices(self, traces):
+        """
+        (pid, list of up to quantum addresses) in scheduling order. Raises ValueError for an
+        address outside addressBits, the tag would otherwise turn it into another process's.
+        """
+        rng = random.Random(self.seed)
+        iters = [iter(trace) for trace in traces]
+        alive = deque(range(len(traces)))
+        while alive:
+            if self.scheduler == 'random':
+                pid = alive[rng.randrange(len(alive))]
+            else:
+                pid = alive[0]
+                alive.rotate(-1)
+            chunk = list(itertools.islice(iters[pid], self.quantum))
+            if len(chunk) < self.quantum:
+                alive.remove(pid)
+            address = outsideAddress(chunk, self.addressBits)
+            if address is not None:
+                raise ValueError(f'{self.names[pid]}: address {address} is outside the '
+                                 f'{self.addressBits} bit address space')
+            if chunk:
+                yield pid, chunk
+    def tagged(self, traces): # the interleaved trace the Simulator sees, for OPT
+        for pid, chunk in self.slices(traces):
+            yield from map(self.tags[pid].__xor__, chunk) # xor tags reads and writes (~address) alike
+
+    def switch(self, pid: int):
+        sim = self.sim
+        if self.current is not None:
+            self.contextSwitches += 1
+            if self.tlbTags == 'flush':
+                sim.tlb.flush()
+        if self.policies:
+            sim.policy = self.policies[pid]
+            sim.memory.switch(pid)
+        self.current = pid
+    def run(self, sim: Simulator, traces, policies: List[ReplacementPolicy]=None):
+        self.sim = sim
+        self.policies = policies
+        for policy in policies or []:
+            policy.attach(sim.pt)
+        for pid, chunk in self.slices(traces):
+            if pid != self.current:
+                self.switch(pid)
+            refs, faults, hits = sim.numAddr, sim.pageFaults, sim.tlbHits
+            sim.run(map(self.tags[pid].__xor__, chunk))
+            refs, faults = sim.numAddr - refs, sim.pageFaults - faults
+            self.refs[pid] += refs
+            self.faults[pid] += faults
+            self.tlbHits[pid] += sim.tlbHits - hits
+            self.quanta[pid] += 1
+            window = self.windows[pid]
+            window.append((refs, faults))
+            if sum(f for _, f in window) > self.thrashThreshold * sum(r for r, _ in window):
+                self.thrashing[pid] += 1
+
+    def printStats(self, output: OutputWriter):
+        output.line(f'Context Switches = {self.contextSwitches}')
+        for pid, name in enumerate(self.names):
+            refs = self.refs[pid] or 1
+            output.line(f'Process {pid} ({name}): References = {self.refs[pid]}, Page Faults = {self.faults[pid]}, '
+                        f'Page Fault Rate = {self.faults[pid] / refs:.3f}, TLB Hit Rate = {self.tlbHits[pid] / refs:.3f}, '
+                        f'Thrashing = {self.thrashing[pid]} of {self.quanta[pid]} quanta')
+        thrashing = [pid for pid in range(len(self.names)) if self.thrashing[pid] * 2 > self.quanta[pid]]
+        if thrashing:
+            output.line(f'Thrashing Processes = {", ".join(str(pid) for pid in thrashing)}')
+
+# LATENCY MODEL (--latency)
+COSTS = {'tlb': 1, 'walk': 100, 'ram': 100, 'disk': 100000, 'writeback': 100000} # nanoseconds
+
+def percentile(hist: dict, fraction: float): # smallest value with at least fraction of the counts at or below it
+    total = sum(hist.values())
+    seen = 0
+    for value in sorted(hist):
+        seen += hist[value]
+        if seen >= fraction * total:
+            return value
+    return 0
+
+class CostModel:
+    """
+    Simulated time. Like Instruments it shadows component methods with wrappers, only when
+    attached, and every reference costs: a TLB lookup, costs['walk'] per memory access of a
+    page walk, costs['disk'] for a demand page-in, costs['writeback'] for writing back a dirty
+    victim, and costs['ram'] for the access itself. The output's .reference() is called once
+    per reference and closes its latency.
+    With queue the disk is a single server on the simulated clock: write-backs (write-behind)
+    and prefetches don't stall the reference that causes them, but keep the disk busy, and a
+    demand page-in waits for the disk to finish what is ahead of it. Without queue prefetches
+    (and the write-backs they cause) cost nothing and other write-backs are paid by the
+    faulting reference.
+    Latencies are kept in a histogram (latency -> count) for the percentiles, and one row of
+    the time series is closed every interval references.
+    """
+    def __init__(self, costs: dict=None, queue: bool=False, interval: int=10000):
+        self.costs = dict(COSTS, **(costs or {}))
+        self.queue = queue
+        self.interval = interval
+        self.clock = 0 # simulated ns at the start of the current reference
+        self.pending = 0 # ns spent on the current reference so far
+        self.diskFree = 0 # when the disk finishes its queue
+        self.diskWait = 0 # ns demand page-ins spent queued
+        self.background = False # inside a read-ahead
+        self.hist = defaultdict(int)
+        self.window = defaultdict(int) # histogram of the current interval
+        self.series = [] # (first reference, references, mean ns, p99 ns)
+        self.refs = 0
+
+    def _disk(self, service: int, wait: bool): # queue one disk request, returns the ns the reference waits
+        now = self.clock + self.pending
+        start = max(now, self.diskFree)
+        self.diskFree = start + service
+        return self.diskFree - now if wait else 0
+    def attach(self, sim: Simulator):
+        costs, pt = self.costs, sim.pt
+        tlbCost, walkCost, ramCost = costs['tlb'], costs['walk'], costs['ram']
+        diskCost, writebackCost = costs['disk'], costs['writeback']
+        tlbLookup, ptLookup, getpage, writepage = sim.tlb.lookup, pt.lookup, sim.disk.getpage, sim.disk.writepage
+        reference, readAhead = sim.output.reference, sim.readAhead
+        def lookup(pageNumber: int):
+            self.pending += tlbCost
+            return tlbLookup(pageNumber)
+        def walk(pageNumber: int):
+            before = pt.walkAccesses
+            frameNumber = ptLookup(pageNumber)
+            self.pending += (pt.walkAccesses - before) * walkCost
+            return frameNumber
+        def pageIn(pageNumber: int):
+            if self.queue:
+                waited = self._disk(diskCost, wait=not self.background)
+                if waited:
+                    self.diskWait += waited - diskCost
+                    self.pending += waited
+            elif not self.background:
+                self.pending += diskCost
+            return getpage(pageNumber)
+        def writeBack(pageNumber: int, data):
+            if self.queue:
+                self._disk(writebackCost, wait=False)
+            elif not self.background: # read-ahead's evictions are as free as its page-ins
+                self.pending += writebackCost
+            return writepage(pageNumber, data)
+        def ahead(pageNumber: int, pages, index: int):
+            self.background = True
+            try:
+                return readAhead(pageNumber, pages, index)
+            finally:
+                self.background = False
+        def done(address: int, frameNumber: int, offset: int):
+            latency = self.pending + ramCost
+            self.hist[latency] += 1
+            self.window[latency] += 1
+            self.clock += latency
+            self.pending = 0
+            self.refs += 1
+            if self.refs % self.interval == 0:
+                self._row()
+            return reference(address, frameNumber, offset)
+        sim.tlb.lookup, pt.lookup, sim.disk.getpage, sim.disk.writepage = lookup, walk, pageIn, writeBack
+        sim.output.reference, sim.readAhead = done, ahead
+    def _row(self):
+        count = sum(self.window.values())
+        if count:
+            mean = sum(latency * n for latency, n in self.window.items()) / count
+            self.series.append((self.refs - count, count, mean, percentile(self.window, 0.99)))
+        self.window = defaultdict(int)
+
+    def printStats(self, output: OutputWriter):
+        self._row() # the last, partial interval
+        refs = self.refs or 1
+        output.line(f'Simulated Time = {self.clock / 1e6:.3f} ms')
+        output.line(f'Effective Access Time = {self.clock / refs:.1f} ns')
+        output.line(f'Access Time p50 = {percentile(self.hist, 0.5)} ns, p99 = {percentile(self.hist, 0.99)} ns, '
+                    f'p999 = {percentile(self.hist, 0.999)} ns')
+        if self.queue:
+            output.line(f'Disk Queueing Delay = {self.diskWait / 1e6:.3f} ms')
+        output.line('Access Time Series = first reference, references, mean ns, p99 ns')
+        for first, count, mean, p99 in self.series:
+            output.line(f'{first}, {count}, {mean:.1f}, {p99}')
+
+# INSTRUMENTATION (--instrument, --progress, --profile)
+class Instruments:
+    """
+    Opt-in counters and timers for the parts of a simulation. The simulator doesn't know about
+    it: .attach() shadows the methods the hot loop calls with wrappers on those instances only,
+    so a run without instruments executes exactly the same code as before.
+    With timers every component call is counted and timed. With every set, sim.run() is
+    wrapped to write a progress snapshot every that many references: refs/sec and the page
+    fault rate over the last window snapshots.
+    """
+    COMPONENTS = [('tlb.lookup', 'tlb', 'lookup'), ('pt.lookup', 'pt', 'lookup'),
+                  ('ram.setitem', 'memory', 'setitem'), ('policy.choose_victim', 'policy', 'choose_victim'),
+                  ('disk.getpage', 'disk', 'getpage'), ('output.reference', 'output', 'reference')]
+
+    def __init__(self, timers: bool=True, every: int=None, window: int=10, file=None):
+        self.timers = timers
+        self.every = every
+        self.file = file or sys.stderr
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.faults = 0
+        self.refs = 0 # references seen by the progress wrapper
+        self.snapshots = deque(maxlen=window + 1) # (refs, faults, time)
+        self.runSeconds = 0.0
+        self.countdown = None
+
+    def _timed(self, name: str, fn):
+        calls, seconds, clock = self.calls, self.seconds, time.perf_counter
+        def timed(*args):
+            start = clock()
+            result = fn(*args)
+            seconds[name] += clock() - start
+            calls[name] += 1
+            return result
+        return timed
+    def _counted(self, fn): # page faults, for the progress snapshots
+        def counted(*args):
+            self.faults += 1
+            return fn(*args)
+        return counted
+    def attach(self, sim: Simulator, policies: List[ReplacementPolicy]=None): # policies, for local replacement
+        if self.timers:
+            for name, owner, method in self.COMPONENTS:
+                if owner == 'policy':
+                    continue
+                component = getattr(sim, owner)
+                setattr(component, method, self._timed(name, getattr(component, method)))
+        for policy in policies or [sim.policy]:
+            if self.timers:
+                policy.choose_victim = self._timed('policy.choose_victim', policy.choose_victim)
+            policy.on_fault = self._counted(policy.on_fault)
+        run = sim.run
+        def timedRun(trace):
+            start = time.perf_counter()
+            try:
+                run(self.progress(trace) if self.every else trace)
+            finally:
+                self.runSeconds += time.perf_counter() - start
+        sim.run = timedRun
+
+    def progress(self, trace): # pass the trace through, snapshot after every `every` references
+        countdown = segment = self.countdown or self.every # carries over when a trace is run in pieces
+        if not self.snapshots:
+            self.snapshots.append((self.refs, self.faults, time.perf_counter()))
+        for address in trace:
+            yield address # the simulator has handled it once it asks for the next one
+            countdown -= 1
+            if not countdown:
+                self.refs += segment
+                countdown = segment = self.every
+                self.snapshot()
+        self.refs += segment - countdown
+        self.countdown = countdown
+    def snapshot(self):
+        now = (self.refs, self.faults, time.perf_counter())
+        oldRefs, oldFaults, oldTime = self.snapshots[0]
+        self.snapshots.append(now)
+        refs = now[0] - oldRefs
+        elapsed = now[2] - oldTime
+        print(f'progress: {now[0]} references, {refs / elapsed if elapsed else 0.0:,.0f} refs/s, '
+              f'fault rate {(now[1] - oldFaults) / refs if refs else 0.0:.3f} over the last {refs} references, '
+              f'{now[1]} page faults', file=self.file, flush=True)
+
+    def report(self):
+        if not self.timers:
+            return
+        print(f'{"component":<22}{"calls":>12}{"seconds":>12}{"ns/call":>10}', file=self.file)
+        timed = 0.0
+        for name, _, _ in self.COMPONENTS:
+            calls, seconds = self.calls[name], self.seconds[name]
+            timed += seconds
+            print(f'{name:<22}{calls:>12}{seconds:>12.3f}{seconds / calls * 1e9 if calls else 0.0:>10.0f}', file=self.file)
+        # the rest is the loop itself, the policy bookkeeping and the timers' own overhead
+        print(f'{"other":<22}{"":>12}{max(self.runSeconds - timed, 0.0):>12.3f}', file=self.file)
+        print(f'{"total":<22}{"":>12}{self.runSeconds:>12.3f}', file=self.file)
+
+def profiled(kind: str, fn, *args, file=None, interval: float=0.001):
+    """
+    fn(*args), under a profiler when kind is set. The report goes to file (stderr):
+        'cprofile' - deterministic, every call is traced, slows the hot loop down a lot
+        'sample'   - statistical, records the running line every interval seconds of CPU time (Unix only)
+    """
+    file = file or sys.stderr
+    if kind is None:
+        return fn(*args)
+    if kind == 'cprofile':
+        import cProfile, pstats
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(fn, *args)
+        finally:
+            pstats.Stats(profile, stream=file).sort_stats('tottime').print_stats(25)
+    samples = defaultdict(int)
+    def sample(signum, frame):
+        samples[(frame.f_code.co_name, frame.f_lineno)] += 1
+    previous = signal.signal(signal.SIGPROF, sample)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, previous)
+        total = sum(samples.values()) or 1
+        print(f'{total} samples every {interval * 1000:g} ms of CPU time', file=file)
+        for (name, line), count in sorted(samples.items(), key=lambda item: -item[1])[:25]:
+            print(f'{count / total:>7.1%}  {name}:{line}', file=file)
+
+# CHECKPOINTS (--checkpoint, --resume)
+SNAPSHOT_MAGIC = b'MEMSNAP1'
+
+def saveCheckpoint(filename: str, sim: Simulator, config: dict, segment: str, offset: int):
+    """
+    Write the whole simulator state (page table, TLB, RAM, policy, prefetcher and counters are
+    pickled with the Simulator, the overlay through Disk.snapshot()) to filename, through a
+    temporary file so a crash never leaves half a checkpoint. segment is the trace being run
+    and offset how many of its references are done, config what is needed to reopen the disk.
+    """
+    state = {'config': config, 'sim': sim, 'disk': sim.disk.snapshot(), 'segment': segment, 'offset': offset}
+    with open(filename + '.tmp', 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(filename + '.tmp', filename)
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    """
+    Classes pickled by memSim.py run as a script belong to __main__, by an imported memSim
+    to memSim. Either way they are looked up in this module, so a checkpoint loads in both.
+    """
+    def find_class(self, module: str, name: str):
+        if module in ('__main__', 'memSim'):
+            module = __name__
+        return super().find_class(module, name)
+
+def loadCheckpoint(filename: str):
+    """
+    The dict saveCheckpoint() wrote, sim comes back without disk and output. This unpickles
+    the file, only load checkpoints from a trusted source.
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f'{filename} is not a memSim checkpoint')
+        return _CheckpointUnpickler(f).load()
+
+def runCheckpointed(sim: Simulator, trace, filename: str, every: int, config: dict, segment: str, offset: int):
+    """
+    sim.run(trace) in pieces, with a checkpoint every `every` references (if set) and at the end.
+    On SIGTERM the piece that is running finishes, a checkpoint is written and the process
+    exits with status 143. offset is how many references of segment came before trace.
+    """
+    trace = iter(trace)
+    stop = []
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: stop.append(signum))
+    try:
+        sinceSave = 0
+        while True:
+            piece = min(every - sinceSave, TRACE_CHUNK) if every else TRACE_CHUNK
+            before = sim.numAddr
+            sim.run(itertools.islice(trace, piece))
+            done = sim.numAddr - before
+            offset += done
+            sinceSave += done
+            if done < piece:
+                break
+            if stop:
+                sim.output.flush()
+                saveCheckpoint(filename, sim, config, segment, offset)
+                print(f'Terminated, checkpoint of {sim.numAddr} references written to {filename}', file=sys.stderr)
+                sys.exit(128 + signal.SIGTERM)
+            if every and sinceSave >= every:
+                sim.output.flush() # the output so far goes with the checkpoint
+                saveCheckpoint(filename, sim, config, segment, offset)
+                sinceSave = 0
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    saveCheckpoint(filename, sim, config, segment, offset)
+
+# SERVER (--serve)
+SERVER_FRAME = struct.Struct('<cI') # kind, count (addresses) or length (bytes) of what follows
+SERVER_SLICE = 65536 # references run before yielding to the other clients
+SERVER_MAX_BATCH = 1 << 22 # addresses in one request
+
+class ServerOutput:
+    """
+    The Simulator's output in server mode. .reference() adds the physical address and the
+    byte value of every translated address to .physical and .values, .take() moves them to
+    the reply of the batch that is running; the statistics lines go on to output.
+    """
+    def __init__(self, memory: RAM, output: OutputWriter):
+        self.output = output
+        self.physical = array('Q')
+        self.values = bytearray()
+        ram, frameSize = memory.ram, memory.frameSize
+        appendPhysical, appendValue = self.physical.append, self.values.append
+        def reference(address: int, frameNumber: int, offset: int):
+            physical = frameNumber * frameSize + offset
+            appendPhysical(physical)
+            appendValue(ram[physical])
+        self.reference = reference # a closure, no attribute lookups per reference
+    def take(self, physical: array, values: bytearray): # append what was translated since the last take()
+        physical.extend(self.physical)
+        values.extend(self.values)
+        del self.physical[:], self.values[:]
+    def line(self, text: str):
+        self.output.line(text)
+    def flush(self):
+        self.output.flush()
+
+def serverAddress(text: str): # ('unix', path) for unix:PATH or anything with a /, otherwise ('tcp', host, port)
+    if text.startswith('unix:'):
+        return ('unix', text[5:])
+    if '/' in text:
+        return ('unix', text)
+    host, _, port = text.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f'expected HOST:PORT, PORT or unix:PATH, not {text!r}')
+    return ('tcp', host or '127.0.0.1', int(port))
+
+class SimServer:
+    """
+    Serves one Simulator to any number of clients over a local TCP or Unix socket. Every
+    request and reply is a SERVER_FRAME header followed by its payload:
+        b'T' n, n little endian int64 addresses (~address for a write)
+             -> b'T' n, n uint64 physical addresses, then n bytes of memory (signed, as int8)
+        b'S' 0 -> b'S' length, the JSON counters of .stats()
+    Anything wrong with a request is answered with b'E' length and a message, after an unknown
+    kind the connection is closed since there's no telling where the next request starts.
+    sim's output has to be a ServerOutput. A batch runs through sim.run() SERVER_SLICE references at a time, yielding to the event
+    loop in between, so a big batch doesn't hold up the other clients. A connection's next
+    request is only read once the reply to the last one has drained, so a client that stops
+    reading its replies stops being served without slowing anyone else down.
+    spaces='private' gives every client its own address space, tagged with an address space
+    id above addressBits like MultiSimulator does for processes (the page table needs room
+    for maxClients of them). When a client leaves its pages are thrown away (Simulator.forget())
+    and the id goes back to be reused, so every client starts with an empty address space.
+    'shared' puts every client in the same address space.
+    """
+    def __init__(self, sim: Simulator, addressBits: int, spaces: str='private', maxClients: int=16):
+        self.sim = sim
+        self.addressBits = addressBits
+        self.spaces = spaces
+        self.maxClients = maxClients
+        self.free = deque(range(maxClients)) # address space ids, for private spaces
+        self.clients = 0
+        self.batches = self.served = 0
+        self.busy = 0.0 # seconds spent in sim.run()
+        self.started = time.perf_counter()
+
+    def stats(self):
+        sim = self.sim
+        refs = sim.numAddr or 1
+        uptime = time.perf_counter() - self.started
+        return {'references': sim.numAddr, 'page_faults': sim.pageFaults, 'page_fault_rate': sim.pageFaults / refs,
+                'tlb_hits': sim.tlbHits, 'tlb_hit_rate': sim.tlbHits / refs, 'writes': sim.writes,
+                'write_backs': sim.writeBacks, 'clients': self.clients, 'batches': self.batches,
+                'uptime': uptime, 'refs_per_sec': self.served / uptime if uptime else 0.0,
+                'busy_refs_per_sec': self.served / self.busy if self.busy else 0.0}
+
+    async def translate(self, addresses: array, tag: int):
+        """ Run one batch, returns its physical addresses and values. """
+        limit = 1 << self.addressBits
+        if addresses and (min(addresses) < -limit or max(addresses) >= limit):
+            raise ValueError(f'address outside the {self.addressBits} bit address space')
+        sim, output = self.sim, self.sim.output
+        physical, values = array('Q'), bytearray()
+        for start in range(0, len(addresses), SERVER_SLICE):
+            piece = addresses[start:start + SERVER_SLICE]
+            began = time.perf_counter()
+            try:
+                sim.run(map(tag.__xor__, piece) if tag else piece) # xor tags reads and writes (~address) alike
+            finally:
+                output.take(physical, values) # before another client's slice runs
+                self.busy += time.perf_counter() - began
+            await asyncio.sleep(0)
+        self.batches += 1
+        self.served += len(addresses)
+        return physical, values
+
+    async def handle(self, reader, writer):
+        asid = 0
+        if self.spaces == 'private':
+            asid = self.free.popleft() if self.free else None # None: every request gets an error
+        tag = (asid or 0) << self.addressBits
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    kind, count = SERVER_FRAME.unpack(await reader.readexactly(SERVER_FRAME.size))
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if asid is None and kind == b'T' and count <= SERVER_MAX_BATCH:
+                    await reader.readexactly(count * 8)
+                    message = f'all {self.maxClients} address spaces are in use'.encode()
+                    writer.write(SERVER_FRAME.pack(b'E', len(message)) + message)
+                elif kind == b'T':
+                    if count > SERVER_MAX_BATCH:
+                        message = f'batches are limited to {SERVER_MAX_BATCH} addresses'.encode()
+                        writer.write(SERVER_FRAME.pack(b'E', len(message)) + message)
+                        break # can't skip a payload that big, the client has to reconnect
+                    addresses = array('q')
+                    addresses.frombytes(await reader.readexactly(count * 8))
+                    if sys.byteorder == 'big':
+                        addresses.byteswap()
+                    try:
+                        physical, values = await self.translate(addresses, tag)
+                    except ValueError as e:
+                        message = str(e).encode()
+                        writer.write(SERVER_FRAME.pack(b'E', len(message)) + message)
+                    else:
+                        if sys.byteorder == 'big':
+                            physical.byteswap()
+                        writer.write(SERVER_FRAME.pack(b'T', count))
+                        writer.write(physical.tobytes())
+                        writer.write(values)
+                elif kind == b'S':
+                    body = json.dumps(self.stats()).encode()
+                    writer.write(SERVER_FRAME.pack(b'S', len(body)) + body)
+                else:
+                    message = f'unknown request {kind!r}'.encode()
+                    writer.write(SERVER_FRAME.pack(b'E', len(message)) + message)
+                    break
+                await writer.drain() # backpressure
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass # the client went away in the middle of a request
+        finally:
+            self.clients -= 1
+            if self.spaces == 'private' and asid is not None:
+                pages = self.sim.disk.numPages
+                self.sim.forget(asid * pages, (asid + 1) * pages)
+                self.free.append(asid)
+            writer.close()
+
+    async def serve(self, address: str):
+        """ Serve on address (see serverAddress()) until SIGINT or SIGTERM. """
+        where = serverAddress(address)
+        if where[0] == 'unix':
+            server = await asyncio.start_unix_server(self.handle, where[1])
+        else:
+            server = await asyncio.start_server(self.handle, where[1], where[2])
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        print(f'Serving on {address}', file=sys.stderr)
+        async with server:
+            await stop.wait()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+        if where[0] == 'unix':
+            os.unlink(where[1])
+
+class SimClient:
+    """
+    asyncio client for SimServer:
+        client = await SimClient.connect('unix:/tmp/memsim.sock')
+        physical, values = await client.translate([4096, ~8192, 12])
+        print((await client.stats())['page_fault_rate'])
+        await client.close()
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, address: str):
+        where = serverAddress(address)
+        if where[0] == 'unix':
+            return cls(*await asyncio.open_unix_connection(where[1]))
+        return cls(*await asyncio.open_connection(where[1], where[2]))
+
+    async def request(self, kind: bytes, count: int, payload: bytes=b''):
+        self.writer.write(SERVER_FRAME.pack(kind, count) + payload)
+        await self.writer.drain()
+        kind, count = SERVER_FRAME.unpack(await self.reader.readexactly(SERVER_FRAME.size))
+        if kind == b'E':
+            raise RuntimeError((await self.reader.readexactly(count)).decode())
+        return count
+
+    async def translate(self, addresses):
+        """ One batch, returns array('Q') of physical addresses and array('b') of values. """
+        addresses = array('q', addresses)
+        if sys.byteorder == 'big':
+            addresses.byteswap()
+        count = await self.request(b'T', len(addresses), addresses.tobytes())
+        physical = array('Q')
+        physical.frombytes(await self.reader.readexactly(count * 8))
+        if sys.byteorder == 'big':
+            physical.byteswap()
+        values = array('b')
+        values.frombytes(await self.reader.readexactly(count))
+        return physical, values
+
+    async def stats(self):
+        return json.loads(await self.reader.readexactly(await self.request(b'S', 0)))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+# VECTORIZED FRONT END (--vectorize)
+def loadTraceArray(filename: str, fmt: str='auto'):
+    """
+    The whole trace as a numpy uint64 array. Binary traces are read straight from the file,
+    text traces go through readTrace one chunk at a time. Traces with writes raise ValueError.
+    """
+    import numpy as np # only --vectorize needs numpy
+    if fmt == 'auto':
+        fmt = traceFormat(filename)
+    if fmt == 'bin' and not filename.endswith(('.gz', '.xz')):
+        with open(filename, 'rb') as f:
+            _, width, flags = TRACE_HEADER.unpack(f.read(TRACE_HEADER.size))
+        if flags & TRACE_WRITES:
+            raise ValueError('--vectorize only handles read only traces')
+        return np.fromfile(filename, dtype='<u4' if width == 4 else '<u8', offset=TRACE_HEADER.size).astype(np.uint64)
+    try:
+        chunks = [np.array(chunk, dtype=np.uint64) for chunk in readTrace(filename, fmt)]
+    except OverflowError: # a write, ~address is negative
+        raise ValueError('--vectorize only handles read only traces') from None
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint64)
+
+def compressTrace(addresses, pageSize: int, collapse: bool=True):
+    """
+    Split the address array into page numbers and offsets with a shift and a mask, and mark
+    which references the simulator has to see. In a run of references to the same page only
+    the first two are kept: once the second one is done the TLB and the policy are in a state
+    that further references to the page can't change (the second one is needed because a
+    FIFO TLB that refills on every access may still move the page to the back of the queue).
+    That doesn't hold with a prefetcher, whose read-ahead evicts pages between references.
+    Returns (pages, offsets, kept) where kept holds the indexes of the kept references.
+    """
+    import numpy as np
+    shift = np.uint64(pageSize.bit_length() - 1)
+    pages = addresses >> shift
+    offsets = addresses & np.uint64(pageSize - 1)
+    if not collapse or len(addresses) < 3:
+        return pages, offsets, np.arange(len(addresses))
+    keep = np.empty(len(pages), dtype=bool)
+    keep[0] = True
+    np.not_equal(pages[1:], pages[:-1], out=keep[1:]) # first of a run
+    keep[1:] |= keep[:-1].copy() # and the one after it
+    return pages, offsets, np.flatnonzero(keep)
+
+def runVectorized(sim: Simulator, addresses, pages, offsets, kept):
+    """
+    Feed the kept references of compressTrace() to sim.run() and account for the skipped
+    ones in bulk. A skipped reference repeats the page of the reference before it, so it is
+    a TLB hit if that page is in the TLB, otherwise a TLB miss and a page table hit (the
+    page walk is still counted). The output still gets one line per address.
+    """
+    pt, tlb, output = sim.pt, sim.tlb, sim.output
+    quiet = output.level == 'stats'
+    addressList = addresses.tolist() if not quiet else None
+    offsetList = offsets.tolist() if not quiet else None
+    keptList = kept.tolist()
+    keptList.append(len(addresses)) # sentinel
+
+    def feed():
+        for i in range(len(keptList) - 1):
+            yield addressList[keptList[i]] if addressList is not None else int(addresses[keptList[i]])
+            repeats = keptList[i + 1] - keptList[i] - 1
+            if repeats:
+                p = int(pages[keptList[i]])
+                frameNumber = tlb.getitem(p)
+                if frameNumber is not None:
+                    sim.tlbHits += repeats
+                else:
+                    sim.tlbMisses += repeats
+                    for _ in range(repeats):
+                        frameNumber = pt.lookup(p)
+                sim.numAddr += repeats
+                if not quiet:
+                    for j in range(keptList[i] + 1, keptList[i + 1]):
+                        output.reference(addressList[j], frameNumber, offsetList[j])
+    sim.run(feed())
+
+ARRAY_PAGE_TABLE_MAX = 2**22 # pages, a 24 MB ArrayPageTable
+
+def makePageTable(layout: str, size: int, frames: int): # 'flat', 'two-level', 'three-level' or 'inverted'
+    if layout == "two-level":
+        return RadixPageTable(size=size, levels=2)
+    if layout == "three-level":
+        return RadixPageTable(size=size, levels=3)
+    if layout == "inverted":
+        return InvertedPageTable(size=size, frames=frames)
+    if size <= ARRAY_PAGE_TABLE_MAX:
+        return ArrayPageTable(size=size)
+    return PageTable(size=size) # sparse, for huge address spaces
+
+# BATCH RUNS (--batch)
+BATCH_FIELDS = ['trace', 'pra', 'frames', 'tlb_size', 'addresses', 'page_faults', 'page_fault_rate',
+                'tlb_hits', 'tlb_misses', 'tlb_hit_rate', 'walk_cost', 'writes', 'write_backs', 'prefetches', 'prefetch_hits', 'seconds']
+
+def batchJob(job: dict):
+    """
+    Run one simulation of a batch in a worker process and return its row of results.
+    The trace is a binary trace and the backing store is mmapped, so every worker reads
+    the same pages of the OS page cache instead of parsing its own copy.
+    """
+    start = time.perf_counter()
+    pageSize, addressBits, frames = job['page_size'], job['address_bits'], job['frames']
+    pt = makePageTable(job['page_table'], 2**addressBits // pageSize, frames)
+    tlb = TLB(size=job['tlb_size'], ways=job['tlb_ways'], policy=job['tlb_policy'])
+    memory = RAM(size=frames, frameSize=pageSize)
+    disk = Disk(job['backing_store'], pageSize=pageSize, size=2**addressBits)
+    trace = iterTrace(job['binary'], 'bin')
+    pages = None
+    if job['pra'] == 'opt':
+        trace = list(trace)
+        pages = tracePages(trace, pageSize)
+    policy = makePolicy(job['pra'], frames, pages)
+    sim = Simulator(pt, tlb, memory, disk, policy, OutputWriter(memory, level='stats'), pageSize=pageSize,
+                    prefetcher=makePrefetcher(job['prefetch'], job['prefetch_depth']))
+    sim.run(trace)
+    disk.close()
+    n = sim.numAddr or 1
+    return {'trace': job['trace'], 'pra': job['pra'], 'frames': frames, 'tlb_size': job['tlb_size'],
+            'addresses': sim.numAddr, 'page_faults': sim.pageFaults, 'page_fault_rate': sim.pageFaults / n,
+            'tlb_hits': sim.tlbHits, 'tlb_misses': sim.tlbMisses, 'tlb_hit_rate': sim.tlbHits / n,
+            'walk_cost': pt.walkCost(), 'writes': sim.writes, 'write_backs': sim.writeBacks,
+            'prefetches': sim.prefetches, 'prefetch_hits': sim.prefetchHits, 'seconds': time.perf_counter() - start}
+
+def checkBatchSpec(spec):
+    """ Raises ValueError if a run of the --batch grid would fail, before any of them starts. """
+    if not isinstance(spec, dict):
+        raise ValueError("the grid must be a JSON object")
+    for key in ('traces', 'policies', 'frames'):
+        if not isinstance(spec.get(key), list) or not spec[key]:
+            raise ValueError(f"the grid needs a non-empty list of {key}")
+    for trace in spec['traces'] + [spec.get('backing_store', 'BACKING_STORE.bin')]:
+        if not isinstance(trace, str) or not os.path.isfile(trace):
+            raise ValueError(f"no such file: {trace}")
+    for pra in spec['policies']:
+        if pra not in POLICIES:
+            raise ValueError(f"unknown policy {pra!r}, choose from {', '.join(POLICIES)}")
+    tlbSizes = spec.get('tlb_sizes', [TLB_SIZE])
+    for key, values in (('frames', spec['frames']), ('tlb_sizes', tlbSizes)):
+        if not isinstance(values, list) or not all(isinstance(value, int) and value >= 1 for value in values):
+            raise ValueError(f"{key} must be a list of numbers of at least 1")
+    pageSize = spec.get('page_size', PAGE_SIZE)
+    if not isinstance(pageSize, int) or pageSize < 1 or pageSize & (pageSize - 1):
+        raise ValueError("page_size must be a power of two")
+    if 2**spec.get('address_bits', DISK_SIZE.bit_length() - 1) < pageSize:
+        raise ValueError("address_bits is too small to hold a single page")
+    ways = spec.get('tlb_ways')
+    if ways is not None and (ways < 1 or any(size % ways for size in tlbSizes)):
+        raise ValueError("tlb_ways must divide every tlb size")
+    for key, choices in (('page_table', ["flat", "two-level", "three-level", "inverted"]),
+                         ('tlb_policy', ["fifo", "lru", "random"]), ('trace_format', ["auto", "dec", "hex", "bin"]),
+                         ('prefetch', list(PREFETCHERS))):
+        if key in spec and spec[key] is not None and spec[key] not in choices:
+            raise ValueError(f"{key} must be one of {', '.join(choices)}")
+    if spec.get('prefetch') and 'opt' in spec['policies']:
+        raise ValueError("opt can't be combined with prefetch, it only knows the pages of the trace")
+    if spec.get('prefetch_depth') is not None and spec['prefetch_depth'] < 1:
+        raise ValueError("prefetch_depth must be at least 1")
+    if spec.get('workers') is not None and spec['workers'] < 1:
+        raise ValueError("workers must be at least 1")
+
+def runBatch(spec: dict, output: OutputWriter, fmt: str='csv'):
+    """
+    Run every combination of spec['traces'] x spec['policies'] x spec['frames'] x spec['tlb_sizes']
+    on a process pool and write one CSV (or JSON) report. The other keys of spec are optional
+    and apply to every run: page_size, address_bits, page_table, tlb_ways, tlb_policy,
+    backing_store, trace_format, prefetch, prefetch_depth and workers (defaults to every core).
+    Each trace is parsed once, into a temporary binary trace that all the workers mmap.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        binaries = {}
+        traceFmt = spec.get('trace_format', 'auto')
+        for i, trace in enumerate(spec['traces']):
+            if traceFmt == 'auto' and traceFormat(trace) == 'bin' and not trace.endswith(('.gz', '.xz')):
+                binaries[trace] = trace # already binary, nothing to convert
+                continue
+            binaries[trace] = os.path.join(tmp, f'{i}.bin')
+            convertTrace(trace, binaries[trace], traceFmt)
+        jobs = [{'trace': trace, 'binary': binaries[trace], 'pra': pra, 'frames': frames, 'tlb_size': tlbSize,
+                 'page_size': spec.get('page_size', PAGE_SIZE),
+                 'address_bits': spec.get('address_bits', DISK_SIZE.bit_length() - 1),
+                 'page_table': spec.get('page_table', 'flat'),
+                 'tlb_ways': spec.get('tlb_ways'), 'tlb_policy': spec.get('tlb_policy', 'fifo'),
+                 'backing_store': spec.get('backing_store', 'BACKING_STORE.bin'),
+                 'prefetch': spec.get('prefetch'), 'prefetch_depth': spec.get('prefetch_depth')}
+                for trace in spec['traces'] for pra in spec['policies']
+                for frames in spec['frames'] for tlbSize in spec.get('tlb_sizes', [TLB_SIZE])]
+        with ProcessPoolExecutor(max_workers=spec.get('workers')) as pool:
+            results = list(pool.map(batchJob, jobs))
+    if fmt == 'json':
+        output.line(json.dumps(results, indent=2))
+    else:
+        output.line(','.join(BATCH_FIELDS))
+        for row in results:
+            output.line(','.join(f'{row[field]:.6f}' if isinstance(row[field], float) else str(row[field])
+                                 for field in BATCH_FIELDS))
+    return results
 
 # Main will do all the simulation logic, prob should use helper functions.
 def main():
 
     parser = argparse.ArgumentParser(description="Memory Simulator")
-    # Required argument for reference-sequence-file.txt
-    parser.add_argument("reference_sequence_file", type=str,
+    # Required argument for reference-sequence-file.txt (unless running a --batch)
+    parser.add_argument("reference_sequence_file", type=str, nargs="?",
                         help="File containing the list of logical memory addresses")
     # Optional argument for FRAMES with a default value of 256
     parser.add_argument("frames", type=int, nargs="?", default=256,
                         help="Number of frames in the system. Default is 256.")
     # Optional argument for PRA with a default value of "fifo"
-    parser.add_argument("pra", type=str, choices=["fifo", "lru", "opt"], nargs="?", default="fifo",
-                        help="Page Replacement Algorithm. Choices are 'fifo', 'lru', or 'opt'. Default is 'fifo'.")
+    parser.add_argument("pra", type=str, choices=list(POLICIES), nargs="?", default="fifo",
+                        help="Page Replacement Algorithm. Choices are 'fifo', 'lru', 'opt', 'clock' (same as 'second-chance'), "
+                             "'enhanced-clock', 'lfu', 'arc', '2q' or 'wsclock'. Default is 'fifo'.")
+    # Optional arguments for the tunable algorithms
+    parser.add_argument("--lfu-aging", type=int, default=None,
+                        help="lfu halves every use count after this many references. Default is 8 * FRAMES.")
+    parser.add_argument("--ws-window", type=int, default=None,
+                        help="wsclock working set window, in references. Default is 4 * FRAMES.")
+    # Optional flag to get the page faults for every frame count from 1 to FRAMES in one pass
+    parser.add_argument("--sweep", action="store_true",
+                        help="Print a CSV of page faults for every frame count from 1 to FRAMES (lru or opt only).")
+    # Optional arguments for the shape of the address space
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE,
+                        help=f"Page (and frame) size in bytes, a power of two. Default is {PAGE_SIZE}.")
+    parser.add_argument("--address-bits", type=int, default=DISK_SIZE.bit_length() - 1,
+                        help="Width of a logical address, the page table has 2^bits / page size entries. Default is 16.")
+    parser.add_argument("--tlb-size", type=int, default=TLB_SIZE,
+                        help=f"Number of TLB entries. Default is {TLB_SIZE}.")
+    parser.add_argument("--tlb-ways", type=int, default=None,
+                        help="TLB associativity, must divide the TLB size (1 is direct-mapped). Default is fully associative.")
+    parser.add_argument("--tlb-policy", type=str, choices=["fifo", "lru", "random"], default="fifo",
+                        help="Replacement policy inside a TLB set. Default is 'fifo'.")
+    parser.add_argument("--tlb-fill", type=str, choices=["fault", "access"], default=None,
+                        help="When translations go into the TLB: only on page faults, or on every access. "
+                             "Default is 'access' for fifo and 'fault' for the others, as in the original simulator.")
+    parser.add_argument("--backing-store", type=str, default="BACKING_STORE.bin",
+                        help="Backing store file, pages past its end read as zeros. Default is BACKING_STORE.bin.")
+    parser.add_argument("--overlay", type=str, metavar="FILE", default=None,
+                        help="Copy-on-write overlay that dirty pages are written back to, the backing store is never "
+                             "modified. Default is a temporary file.")
+    parser.add_argument("--prefer-clean", type=int, metavar="N", default=0,
+                        help="fifo and lru evict the first clean page among the N oldest, to avoid write-backs. Default is 0 (off).")
+    # Optional arguments for the output
+    parser.add_argument("--verbosity", type=str, choices=["full", "nodump", "stats"], default="full",
+                        help="Per address output: 'full' (address, value, frame, frame contents), 'nodump' (no frame contents) "
+                             "or 'stats' (only the statistics). Default is 'full'.")
+    parser.add_argument("-o", "--output", type=str, metavar="FILE",
+                        help="Write the output to FILE instead of stdout.")
+    # Optional arguments for reading and converting traces
+    parser.add_argument("--trace-format", type=str, choices=["auto", "dec", "hex", "bin"], default="auto",
+                        help="Trace format: decimal or hex text (one address per line) or the binary format. "
+                             "'auto' picks between 'bin' and 'dec'. .gz and .xz files are decompressed. Default is 'auto'.")
+    parser.add_argument("--convert", type=str, metavar="OUT",
+                        help="Convert the trace to the binary format in OUT (compressed if OUT ends in .gz/.xz) and exit.")
+    parser.add_argument("--convert-width", type=int, choices=[32, 64], default=32,
+                        help="Address width of the binary trace written by --convert. Default is 32.")
+    parser.add_argument("--vectorize", action="store_true",
+                        help="Load the trace into a numpy array and skip repeated references to the same page "
+                             "(needs numpy, gives the same results).")
+    # Optional argument for running a whole grid of simulations
+    parser.add_argument("--batch", type=str, metavar="SPEC",
+                        help="Run every combination in the JSON grid SPEC (traces, policies, frames, tlb_sizes) "
+                             "on all cores and print one CSV report, or JSON if --output ends in .json.")
+    parser.add_argument("--page-table", type=str, choices=["flat", "two-level", "three-level", "inverted"], default="flat",
+                        help="Page table layout. Anything other than 'flat' also reports the average page walk cost. Default is 'flat'.")
+    # Optional arguments for reading ahead on page faults
+    parser.add_argument("--prefetch", type=str, choices=list(PREFETCHERS), default=None,
+                        help="Prefetch on page faults: 'sequential' (adaptive read-ahead), 'stride' or 'markov'. Default is none.")
+    parser.add_argument("--prefetch-depth", type=int, metavar="N", default=None,
+                        help="Largest read-ahead window (sequential, default 32), pages ahead along the stride "
+                             "(stride, default 4) or successors prefetched (markov, default 2).")
+    # Optional arguments for the simulated latency
+    parser.add_argument("--latency", action="store_true",
+                        help="Add simulated time to the statistics: effective access time, p50/p99/p999 and a time series.")
+    parser.add_argument("--costs", type=str, metavar="EVENT=NS,...", default="",
+                        help="Override event costs in ns: tlb, walk (per page walk access), ram, disk (page-in) "
+                             "and writeback. Default is " + ",".join(f"{k}={v}" for k, v in COSTS.items()) + ".")
+    parser.add_argument("--disk-queue", action="store_true",
+                        help="Model the disk as a queue: write-backs and prefetches are asynchronous but delay page-ins.")
+    parser.add_argument("--latency-interval", type=int, metavar="REFS", default=10000,
+                        help="References per row of the access time series. Default is 10000.")
+    # Optional arguments for long runs
+    parser.add_argument("--checkpoint", type=str, metavar="FILE",
+                        help="Save the simulator state to FILE at the end of the run, on SIGTERM and every --checkpoint-every references.")
+    parser.add_argument("--checkpoint-every", type=int, metavar="REFS", default=None,
+                        help="References between checkpoints. Default is only at the end and on SIGTERM.")
+    parser.add_argument("--resume", type=str, metavar="FILE",
+                        help="Continue from the checkpoint in FILE: the rest of its trace, or the whole trace if it is a "
+                             "new one (appended to the run). FRAMES, PRA and the memory layout come from the checkpoint. "
+                             "FILE is unpickled, only resume from checkpoints you trust.")
+    # Optional arguments for simulating several processes sharing memory
+    parser.add_argument("--process", type=str, metavar="TRACE", action="append",
+                        help="Add a process running TRACE, repeat for more. The reference sequence file is process 0.")
+    parser.add_argument("--quantum", type=int, default=1000,
+                        help="References a process runs before the scheduler switches. Default is 1000.")
+    parser.add_argument("--scheduler", type=str, choices=["round-robin", "random"], default="round-robin",
+                        help="Which process runs next. Default is 'round-robin'.")
+    parser.add_argument("--replacement", type=str, choices=["global", "local"], default="global",
+                        help="global: evict any process's page, local: every process gets FRAMES / processes frames "
+                             "and evicts its own pages. Default is 'global'.")
+    parser.add_argument("--tlb-tags", type=str, choices=["asid", "flush"], default="asid",
+                        help="TLB entries tagged with an address space id, or a TLB flush on every context switch. Default is 'asid'.")
+    parser.add_argument("--thrash-threshold", type=float, default=0.5,
+                        help="Page fault rate above which a process counts as thrashing. Default is 0.5.")
+    # Optional arguments for serving translations to other programs
+    parser.add_argument("--serve", type=str, metavar="ADDRESS",
+                        help="Translate batches of addresses sent by clients on ADDRESS (HOST:PORT, PORT or unix:PATH) "
+                             "until SIGINT or SIGTERM. The reference sequence file, if given, is run first to warm up.")
+    parser.add_argument("--spaces", type=str, choices=["private", "shared"], default="private",
+                        help="Every client gets its own address space, or all of them share one. Default is 'private'.")
+    parser.add_argument("--max-clients", type=int, default=16,
+                        help="Clients connected at the same time with private address spaces. Default is 16.")
+    parser.add_argument("--server-stats", type=str, metavar="ADDRESS",
+                        help="Print the counters of the server on ADDRESS as JSON and exit.")
+    # Optional arguments for looking inside a run, all of them report to stderr
+    parser.add_argument("--instrument", action="store_true",
+                        help="Count and time the TLB, page table, RAM, victim selection, disk and output calls.")
+    parser.add_argument("--progress", type=int, metavar="REFS", default=None,
+                        help="Print refs/sec and the recent page fault rate every REFS references.")
+    parser.add_argument("--profile", type=str, choices=["cprofile", "sample"], default=None,
+                        help="Profile the simulation with cProfile or a sampling profiler.")
     args = parser.parse_args()
+    page_size = args.page_size
+    if page_size < 1 or page_size & (page_size - 1):
+        parser.error("--page-size must be a power of two")
+    if 2**args.address_bits < page_size:
+        parser.error("--address-bits is too small to hold a single page")
+    if args.tlb_size < 1:
+        parser.error("--tlb-size must be at least 1")
+    if args.tlb_ways is not None and (args.tlb_ways < 1 or args.tlb_size % args.tlb_ways):
+        parser.error("--tlb-ways must divide --tlb-size")
+    if args.sweep and args.pra not in ("lru", "opt"):
+        parser.error("--sweep needs a stack algorithm, use 'lru' or 'opt'")
+    if args.frames < 1:
+        parser.error("FRAMES must be at least 1")
+    if args.prefetch and args.pra == "opt":
+        parser.error("opt can't be combined with --prefetch, it only knows the pages of the trace")
+    if args.prefetch_depth is not None and args.prefetch_depth < 1:
+        parser.error("--prefetch-depth must be at least 1")
+    costs = {}
+    for item in filter(None, args.costs.split(",")):
+        event, _, ns = item.partition("=")
+        if event not in COSTS or not ns.isdigit():
+            parser.error(f"--costs takes EVENT=NS pairs with EVENT one of {', '.join(COSTS)}, not {item!r}")
+        costs[event] = int(ns)
+    if args.prefetch and args.vectorize:
+        parser.error("--prefetch can evict pages --vectorize assumes stay loaded, they can't be combined")
+    if args.latency and args.vectorize:
+        parser.error("--latency needs every reference, it can't be combined with --vectorize")
+    if args.latency_interval < 1:
+        parser.error("--latency-interval must be at least 1")
+    if (args.checkpoint or args.resume) and (args.process or args.vectorize):
+        parser.error("--checkpoint and --resume work with a single trace and without --vectorize")
+    if args.checkpoint and (args.instrument or args.progress or args.latency):
+        parser.error("--checkpoint can't save the state of --instrument, --progress or --latency")
+    if args.checkpoint_every is not None and args.checkpoint_every < 1:
+        parser.error("--checkpoint-every must be at least 1")
+    checkpoint = None
+    if args.resume:
+        try:
+            checkpoint = loadCheckpoint(args.resume)
+        except (OSError, ValueError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            parser.error(f"can't resume: {e}")
+        # the state was built for these, whatever the command line says
+        page_size = checkpoint['config']['page_size']
+        args.address_bits = checkpoint['config']['address_bits']
+        args.backing_store = checkpoint['config']['backing_store']
+        args.overlay = checkpoint['config']['overlay']
+    if args.quantum < 1:
+        parser.error("--quantum must be at least 1")
+    if args.process and args.replacement == "local":
+        if args.pra == "opt":
+            parser.error("opt only works with --replacement global")
+        if args.frames < len(args.process) + 1:
+            parser.error("local replacement needs at least one frame per process")
+    if args.prefer_clean < 0:
+        parser.error("--prefer-clean can't be negative")
+    if args.progress is not None and args.progress < 1:
+        parser.error("--progress must be at least 1")
+    if args.serve and (args.process or args.vectorize or args.sweep or args.convert or args.batch
+                       or args.checkpoint or args.resume):
+        parser.error("--serve can't be combined with --process, --vectorize, --sweep, --convert, --batch, "
+                     "--checkpoint or --resume")
+    if args.serve and args.pra == "opt":
+        parser.error("opt needs the whole trace up front, it can't serve clients")
+    if args.max_clients < 1:
+        parser.error("--max-clients must be at least 1")
+    for address in filter(None, (args.serve, args.server_stats)):
+        try:
+            serverAddress(address)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.vectorize:
+        try:
+            import numpy # noqa: F401
+        except ImportError:
+            parser.error("--vectorize needs numpy (pip install numpy)")
+
+    if args.batch:
+        try:
+            with open(args.batch) as f:
+                spec = json.load(f)
+            checkBatchSpec(spec)
+        except (OSError, ValueError) as e:
+            parser.error(f"--batch {args.batch}: {e}")
+        output = OutputWriter(filename=args.output)
+        runBatch(spec, output, fmt='json' if args.output and args.output.endswith('.json') else 'csv')
+        output.close()
+        return
+    if args.server_stats:
+        async def query():
+            client = await SimClient.connect(args.server_stats)
+            try:
+                return await client.stats()
+            finally:
+                await client.close()
+        try:
+            print(json.dumps(asyncio.run(query()), indent=2))
+        except (OSError, ValueError, RuntimeError) as e:
+            parser.error(f"can't get the server's counters: {e}")
+        return
+    if args.reference_sequence_file is None and not args.serve:
+        parser.error("the following arguments are required: reference_sequence_file")
+    if args.process and (args.convert or args.sweep or args.vectorize):
+        parser.error("--convert, --sweep and --vectorize work on a single trace, not with --process")
+
+    if args.convert:
+        try:
+            count = convertTrace(args.reference_sequence_file, args.convert, args.trace_format,
+                                 widths=(args.convert_width // 8,))
+        except ValueError as e:
+            parser.error(str(e))
+        print(f'Wrote {count} addresses to {args.convert}')
+        return
+
+    if args.sweep:
+        pages = tracePages(iterTrace(args.reference_sequence_file, args.trace_format), page_size)
+        if args.pra == "lru":
+            hist = lruStackDistances(pages, args.frames)
+        else:
+            hist = optStackDistances(pages, args.frames)
+        output = OutputWriter(filename=args.output)
+        printSweep(hist, len(pages), output)
+        output.close()
+        return
     
     # get frames from args
     frames = args.frames
+    # one trace per process, every process gets its own address space
+    names = [args.reference_sequence_file] + (args.process or [])
+    quotas = None
+    if args.process and args.replacement == "local":
+        quotas = [frames // len(names) + (pid < frames % len(names)) for pid in range(len(names))]
 
-    #initialize page table
-    pt = PageTable()
-    #initialize tlb
-    tlb = TLB()
-    #initialize ram
-    memory = RAM(size=frames)
+    if checkpoint: # page table, tlb and ram come back with the simulator
+        pt, tlb, memory = checkpoint['sim'].pt, checkpoint['sim'].tlb, checkpoint['sim'].memory
+    else:
+        #initialize page table, with room for every address space
+        spaces = args.max_clients if args.serve and args.spaces == "private" else len(names)
+        pt = makePageTable(args.page_table, spaces * 2**args.address_bits // page_size, frames)
+        #initialize tlb
+        tlb = TLB(size=args.tlb_size, ways=args.tlb_ways, policy=args.tlb_policy)
+        #initialize ram
+        if quotas:
+            memory = PartitionedRAM(size=frames, quotas=quotas, frameSize=page_size)
+        else:
+            memory = RAM(size=frames, frameSize=page_size)
     #initialize disk
-    disk = Disk("BACKING_STORE.bin")
-
-    # open file to read
-    f = open(args.reference_sequence_file, 'r')
-
-    # statistics to keep track of
-    num_addr = 0
-    page_faults = 0
-    tlb_hits = 0
-    tlb_misses = 0
-
-    if args.pra == "lru": # least recently used
-        lruCache = LRUCache(frames)
-
-        # while loop that goes through the addresses
-        while (address := f.readline().strip()):    
-            # increment counter for this page
-            address = int(address)            
-            num_addr+=1
-
-            # break down into page number and offset
-            p = address // PAGE_SIZE # page number
-            d = address % PAGE_SIZE # page offset
-
-            # check tlb
-            if tlb.contains(p):
-                tlb_hits+=1
-                frame_number = tlb.getitem(p) # get frame number from tlb
-                lruCache.put(p, frame_number) # update lru_cache
-                printInfo(pt, memory, address, p, d, frame_number)
-            else: # check page table
-                tlb_misses+=1
-                # check page table
-                if pt.contains(p): # no page fault
-                    frame_number = pt.getframe(p) # get frame number from page table
-                    lruCache.put(p, frame_number) # update lru_cache
-                    printInfo(pt, memory, address, p, d, frame_number)
-                else: # page fault
-                    page_faults+=1
-                    # check for free frames
-                    if memory.free > 0: # if there are free frames, write to memory, update page table, update tlb
-                        # update page table and write to memory
-                        pt.pageTable[p].frameNumber = memory.setitem(disk.disk[p]) # write frame data to memory
-                        pt.pageTable[p].loadedBit = 1
-                        # update tlb
-                        tlb.add(p, pt.pageTable[p].frameNumber)
-                        # update lru_cache
-                        lruCache.put(p, pt.pageTable[p].frameNumber)
-                        # print info
-                        frame_number = pt.pageTable[p].frameNumber
-                        printInfo(pt, memory, address, p, d, frame_number)
-                    else: # need to invoke page replacement algorithm
-                        # get the LRU node
-                        lru_node = lruCache.getLRU()
-                        # Delete the frame from memory & TLB and update the page table to reflect deletion
-                        memory.deleteitem(lru_node.value)
-                        tlb.deleteitem(lru_node.key)
-                        pt.pageTable[lru_node.key].loadedBit = 0
-                        pt.pageTable[lru_node.key].frameNumber = None
-                        # update page table
-                        pt.pageTable[p].frameNumber = memory.setitem(disk.disk[p]) # write frame data to memory
-                        pt.pageTable[p].loadedBit = 1
-                        # update the tlb
-                        tlb.add(p, pt.pageTable[p].frameNumber)
-                        # update the lru_cache
-                        lruCache.put(p, pt.pageTable[p].frameNumber)
-                        # print info
-                        frame_number = pt.pageTable[p].frameNumber
-                        printInfo(pt, memory, address, p, d, frame_number)
-    elif args.pra == "opt": # optimal replacement
-        # read the addresses into a list
-        pages = []
-        while (address := f.readline().strip()):
-            pages.append(int(address) // PAGE_SIZE)
-        # reset file pointer
-        f.seek(0)
-
-        # while loop that goes through the addresses
-        while (address := f.readline().strip()):    
-            # increment counter for this page
-            address = int(address)            
-            num_addr+=1
-
-            # break down into page number and offset
-            p = address // PAGE_SIZE # page number
-            d = address % PAGE_SIZE # page offset
-            if tlb.contains(p):
-                tlb_hits+=1
-                frame_number = tlb.getitem(p) # get frame number from tlb
-                printInfo(pt, memory, address, p, d, frame_number)
-            else: # check page table
-                tlb_misses+=1
-                # check page table
-                if pt.contains(p): # no page fault
-                    frame_number = pt.getframe(p) # get frame number from page table
-                    printInfo(pt, memory, address, p, d, frame_number)
-                else: # page fault
-                    page_faults+=1
-                    # check for free frames
-                    if memory.free > 0: # if there are free frames, write to memory, update page table, update tlb
-                        # update page table and write to memory
-                        pt.pageTable[p].frameNumber = memory.setitem(disk.disk[p]) # write frame data to memory
-                        pt.pageTable[p].loadedBit = 1
-                        # update tlb
-                        tlb.add(p, pt.pageTable[p].frameNumber)
-                        # print info
-                        frame_number = pt.pageTable[p].frameNumber
-                        printInfo(pt, memory, address, p, d, frame_number)
-                    else: # need to invoke page replacement algorithm
-                        # get frame to remove
-                        rmvPage, rmvFrame = pt.findLongestUnused(pages[num_addr:])
-                        # Delete the frame from memory & TLB and update the page table to reflect deletion
-                        memory.deleteitem(rmvFrame)
-                        tlb.deleteitem(rmvPage)
-                        pt.pageTable[rmvPage].loadedBit = 0
-                        pt.pageTable[rmvPage].frameNumber = None
-                        # update page table
-                        pt.pageTable[p].frameNumber = memory.setitem(disk.disk[p]) # write frame data to memory
-                        pt.pageTable[p].loadedBit = 1
-                        # update the tlb
-                        tlb.add(p, pt.pageTable[p].frameNumber)
-                        # print info
-                        frame_number = pt.pageTable[p].frameNumber
-                        printInfo(pt, memory, address, p, d, frame_number)
-        
-    
-    else:   # first in first out
-        # fifo queue
-        fifo = Queue(maxsize=frames)
-
-        # while loop that goes through the addresses
-        while address := f.readline().strip():
-            # increment addresses read
-            num_addr+=1
-
-            # page number
-            p = int(address) // PAGE_SIZE
-            # page offset
-            d = int(address) % PAGE_SIZE
-
-            # check tlb, check loaded bit
-            if tlb.contains(p):
-                tlb_hits+=1 # increment tlb_hits
-                frame_number = tlb.getitem(p) # get frame number from page-frame pair
-                frame_data = memory.getitem(frame_number)
-                byte_data = int.from_bytes([frame_data[d]], byteorder='little', signed=True)
-
-                # update tlb
-                if tlb.size >= TLB_SIZE:
-                    tlb_remove = findPageTLB(tlb.tlb, frame_number)
-                    if tlb_remove is not None:
-                        if tlb.size != 0:
-                            tlb.deleteitem(tlb_remove)
-                    tlb.add(p, frame_number)
-                else:
-                    tlb.add(p, frame_number)
+    disk = Disk(args.backing_store, pageSize=page_size, size=2**args.address_bits, overlay=args.overlay)
+    if checkpoint:
+        disk.restore(checkpoint['disk'])
+    #initialize output, resuming a trace carries on with the output of the run it continues
+    segment = os.path.abspath(args.reference_sequence_file) if args.reference_sequence_file else None
+    resumed = bool(checkpoint) and checkpoint['segment'] == segment
+    output = OutputWriter(memory, level=args.verbosity, filename=args.output, append=resumed)
+    instruments = None
+    if args.instrument or args.progress:
+        instruments = Instruments(timers=args.instrument, every=args.progress)
+    costModel = None
+    if args.latency:
+        costModel = CostModel(costs, queue=args.disk_queue, interval=args.latency_interval)
 
-                print("{}, {}, {}, {}".format(address, byte_data, frame_number, ''.join(format(i, '02x') for i in frame_data).upper()))
-                # Question: if a page#, frame# pair is in the tlb is it guarenteed to be in memory...do we need to check for page faulting here?
-            
+    if args.process:
+        multi = MultiSimulator(names, args.address_bits, quantum=args.quantum, scheduler=args.scheduler,
+                               tlbTags=args.tlb_tags, thrashThreshold=args.thrash_threshold)
+        traces = [iterTrace(name, args.trace_format) for name in names]
+        pages = policies = None
+        if args.pra == "opt": # the future of the interleaved trace
+            traces = [list(trace) for trace in traces]
+            try:
+                pages = tracePages(multi.tagged(traces), page_size)
+            except ValueError as e:
+                parser.error(str(e))
+        if quotas:
+            policies = [makePolicy(args.pra, quota, lfuAging=args.lfu_aging, wsWindow=args.ws_window,
+                                   cleanScan=args.prefer_clean, totalFrames=frames) for quota in quotas]
+            policy = policies[0]
+        else:
+            policy = makePolicy(args.pra, frames, pages, lfuAging=args.lfu_aging, wsWindow=args.ws_window,
+                                cleanScan=args.prefer_clean)
+        sim = Simulator(pt, tlb, memory, disk, policy, output, pageSize=page_size, tlbFill=args.tlb_fill,
+                        prefetcher=makePrefetcher(args.prefetch, args.prefetch_depth))
+        if costModel:
+            costModel.attach(sim)
+        if instruments:
+            instruments.attach(sim, policies)
+        try:
+            profiled(args.profile, multi.run, sim, traces, policies)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.vectorize:
+        try:
+            addresses = loadTraceArray(args.reference_sequence_file, args.trace_format)
+        except ValueError as e:
+            parser.error(str(e))
+        if len(addresses) and addresses.max() >> args.address_bits:
+            parser.error(f'address {addresses.max()} is outside the {args.address_bits} bit address space')
+        collapse = POLICIES[args.pra].collapsible
+        pages, offsets, kept = compressTrace(addresses, page_size, collapse)
+        # OPT only sees the kept references, skipping repeats doesn't change which page is used next
+        policy = makePolicy(args.pra, frames, pages[kept].tolist() if args.pra == "opt" else None,
+                            lfuAging=args.lfu_aging, wsWindow=args.ws_window, cleanScan=args.prefer_clean)
+        sim = Simulator(pt, tlb, memory, disk, policy, output, pageSize=page_size, tlbFill=args.tlb_fill,
+                        prefetcher=makePrefetcher(args.prefetch, args.prefetch_depth))
+        if instruments:
+            instruments.attach(sim)
+        profiled(args.profile, runVectorized, sim, addresses, pages, offsets, kept)
+    elif args.serve:
+        policy = makePolicy(args.pra, frames, lfuAging=args.lfu_aging, wsWindow=args.ws_window,
+                            cleanScan=args.prefer_clean)
+        sim = Simulator(pt, tlb, memory, disk, policy, ServerOutput(memory, output), pageSize=page_size,
+                        tlbFill=args.tlb_fill, prefetcher=makePrefetcher(args.prefetch, args.prefetch_depth))
+        if costModel:
+            costModel.attach(sim)
+        if instruments:
+            instruments.attach(sim)
+        if args.reference_sequence_file: # warm up, in address space 0, nobody gets the translations
+            try:
+                sim.run(iterTrace(args.reference_sequence_file, args.trace_format, addressBits=args.address_bits))
+            except ValueError as e:
+                parser.error(str(e))
+            sim.output.take(array('Q'), bytearray())
+        server = SimServer(sim, args.address_bits, spaces=args.spaces, maxClients=args.max_clients)
+        try:
+            profiled(args.profile, asyncio.run, server.serve(args.serve))
+        except (OSError, ValueError) as e:
+            parser.error(f"can't serve on {args.serve}: {e}")
+    else:
+        # addresses to translate, a resumed run skips what its checkpoint has done
+        start = checkpoint['offset'] if resumed else 0
+        trace = iterTrace(args.reference_sequence_file, args.trace_format, start=start, addressBits=args.address_bits)
+
+        if checkpoint:
+            sim = checkpoint['sim']
+            sim.disk, sim.output = disk, output
+            if isinstance(sim.policy, OPTPolicy) and start == 0:
+                parser.error("opt only knows the future of the trace it started with, it can't be resumed on a new one")
+        else:
+            # page replacement algorithm
+            pages = None
+            if args.pra == "opt": # OPT needs to see the future
+                try:
+                    trace = list(trace)
+                except ValueError as e:
+                    parser.error(str(e))
+                pages = tracePages(trace, page_size)
+            policy = makePolicy(args.pra, frames, pages, lfuAging=args.lfu_aging, wsWindow=args.ws_window,
+                                cleanScan=args.prefer_clean)
+
+            sim = Simulator(pt, tlb, memory, disk, policy, output, pageSize=page_size, tlbFill=args.tlb_fill,
+                            prefetcher=makePrefetcher(args.prefetch, args.prefetch_depth))
+        if costModel:
+            costModel.attach(sim)
+        if instruments:
+            instruments.attach(sim)
+        try:
+            if args.checkpoint:
+                config = {'page_size': page_size, 'address_bits': args.address_bits,
+                          'backing_store': args.backing_store, 'overlay': args.overlay}
+                profiled(args.profile, runCheckpointed, sim, trace, args.checkpoint, args.checkpoint_every,
+                         config, segment, start)
             else:
-                # increment tlb_misses
-                tlb_misses+=1
-                #check page table, check loaded bit
-                if pt.contains(p): # if hit go to memory
-                    frame_number = pt.getframe(p) # get frame number from page table
-                    frame_data = memory.getitem(frame_number)
-                    byte_data = int.from_bytes([frame_data[d]], byteorder='little', signed=True) # get value
-
-                    # update TLB
-                    # update tlb
-                    if tlb.size >= TLB_SIZE:
-                        tlb_remove = findPageTLB(tlb.tlb, frame_number)
-                        if tlb_remove is not None:
-                            if tlb.size != 0:
-                                tlb.deleteitem(tlb_remove)
-                        tlb.add(p, frame_number)
-                    else:
-                        tlb.add(p, frame_number)
-
-                    print("{}, {}, {}, {}".format(address, byte_data, frame_number, ''.join(format(i, '02x') for i in frame_data).upper()))
-                
-                else: # page fault
-                    page_faults+=1
-                    # check for free frames
-                    if memory.free != 0:
-                        free_index = memory.setitem(disk.disk.get(p)) # could change memory method setitem -> additem and make a true setitem
-
-                        # update pageTable
-                        pt.pageTable[p].frameNumber = free_index
-                        pt.pageTable[p].loadedBit = 1
-
-                        # update tlb
-                        if tlb.size >= TLB_SIZE:
-                            tlb_remove = findPageTLB(tlb.tlb, free_index)
-                            if tlb_remove is not None:
-                                if tlb.size != 0:
-                                    tlb.deleteitem(tlb_remove)
-                            tlb.add(p, free_index)
-                        else:
-                            tlb.add(p, free_index)
-
-                        # put frame in queue
-                        fifo.put(free_index)
-                        
-                        # get data and print
-                        frame_data = memory.getitem(free_index)
-                        byte_data = int.from_bytes([frame_data[d]], byteorder='little', signed=True)
-                        print("{}, {}, {}, {}".format(address, byte_data, free_index, ''.join(format(i, '02x') for i in frame_data).upper()))
-
-                    else: # page swap
-                        # pop queue
-                        removal_index = fifo.get()
-                        # QUESTION: should we remove entries in the tlb if they correspond to this frame number?
-
-                        # remove from memory - do this by overwriting with new page
-                        # add disk page into memory
-                        memory.ram[removal_index] = disk.disk.get(p)
-
-                        # update pageTable
-                        pt_reset = findPagePT(pt.pageTable, removal_index)
-                        if pt_reset is not None:
-                            pt.pageTable[pt_reset].frameNumber = None
-                            pt.pageTable[pt_reset].loadedBit = 0
-
-                        pt.pageTable[p].frameNumber = removal_index
-                        pt.pageTable[p].loadedBit = 1
-
-                        # update tlb
-                        if tlb.size >= TLB_SIZE:
-                            tlb_remove = findPageTLB(tlb.tlb, removal_index)
-                            if tlb_remove is not None:
-                                if tlb.size != 0:
-                                    tlb.deleteitem(tlb_remove)
-                            tlb.add(p, removal_index)
-                        else:
-                            tlb.add(p, removal_index)
-
-                        # put frame in queue
-                        fifo.put(removal_index)
-
-                        # get data and print result
-                        frame_data = memory.ram[removal_index]
-                        byte_data = int.from_bytes([frame_data[d]], byteorder='little', signed=True)
-                        print("{}, {}, {}, {}".format(address, byte_data, removal_index, ''.join(format(i, '02x') for i in frame_data).upper()))
-                    
-                    # restart instruction, sike just print the info in the if, else block to simulate restarting
-                    # restarting means looking at only the page table, not the tlb
-        
-    # print statistics
-    print(f'Number of Translated Addresses = {num_addr}')
-    print(f'Page Faults = {page_faults}')
-    print(f'Page Fault Rate = {(page_faults/num_addr):.3f}')
-    print(f'TLB Hits = {tlb_hits}')
-    print(f'TLB Misses = {tlb_misses}')
-    print(f'TLB Hit Rate = {(tlb_hits/num_addr):.3f}')
-    f.close()
-
-def findPageTLB(tlb, frame_num):
-    index = None
-    for x in range(len(tlb)):
-        if frame_num == tlb[x][1]:
-            index = x
-    
-    if index is None:
-        return index
-    return tlb[index][0]
-
-def findPagePT(pt, frame_num):
-    index = None
-    print(len(pt))
-    for x in range(len(pt)):
-        if frame_num == pt[x].frameNumber:
-            index = x
-
-    return index
+                profiled(args.profile, sim.run, trace)
+        except ValueError as e: # an address outside --address-bits
+            parser.error(str(e))
+    if sim.numAddr or not args.serve: # a server nobody sent anything to has no rates to report
+        sim.printStats(walks=pt.levels > 1) # a flat table always costs one access per walk
+    if args.process:
+        multi.printStats(output)
+    if costModel:
+        costModel.printStats(output)
+    output.close()
+    if instruments:
+        instruments.report()
+    disk.close()
 
 
 if __name__ == "__main__":
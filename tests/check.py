@@ -0,0 +1,201 @@
+"""
+Consistency checks for memSim.py, the things the traces in this directory don't cover.
+
+    python3 tests/check.py
+
+Prints one line per check and exits with status 1 if any of them failed.
+"""
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import memSim # noqa: E402
+
+BACKING_STORE = os.path.join(ROOT, 'BACKING_STORE.bin')
+ADDRESS_BITS = 16
+NUM_PAGES = 2**ADDRESS_BITS // memSim.PAGE_SIZE
+
+def workload(n: int, seed: int, writes: float=0.1):
+    """ A hot set with the odd jump elsewhere, runs of references to the same page, some writes. """
+    rng = random.Random(seed)
+    hot = rng.sample(range(NUM_PAGES), 24)
+    addresses = []
+    while len(addresses) < n:
+        page = rng.choice(hot) if rng.random() < 0.8 else rng.randrange(NUM_PAGES)
+        for _ in range(rng.randrange(1, 6)):
+            address = page * memSim.PAGE_SIZE + rng.randrange(memSim.PAGE_SIZE)
+            addresses.append(~address if rng.random() < writes else address)
+    return addresses[:n]
+
+def runLocal(pra: str, traces, frames: int):
+    """ traces as processes with --replacement local, returns the Simulator and the quotas. """
+    quotas = [frames // len(traces) + (pid < frames % len(traces)) for pid in range(len(traces))]
+    memory = memSim.PartitionedRAM(size=frames, quotas=quotas)
+    disk = memSim.Disk(BACKING_STORE)
+    output = memSim.OutputWriter(memory, level='stats', filename=os.devnull)
+    policies = [memSim.makePolicy(pra, quota, totalFrames=frames) for quota in quotas]
+    sim = memSim.Simulator(memSim.makePageTable('flat', len(traces) * NUM_PAGES, frames), memSim.TLB(),
+                           memory, disk, policies[0], output)
+    multi = memSim.MultiSimulator([str(pid) for pid in range(len(traces))], ADDRESS_BITS, quantum=500)
+    multi.run(sim, traces, policies)
+    output.close()
+    disk.close()
+    return sim, quotas
+
+def checkLocalReplacement():
+    """ Every policy under local replacement: no process ever holds more frames than its quota. """
+    failures = []
+    traces = [workload(20000, seed) for seed in range(3)]
+    for pra in memSim.POLICIES:
+        if pra == 'opt': # global replacement only
+            continue
+        try:
+            sim, quotas = runLocal(pra, traces, 31)
+        except Exception as e: # noqa: BLE001
+            failures.append(f'{pra}: {type(e).__name__}: {e}')
+            continue
+        for pid, quota in enumerate(quotas):
+            resident = sum(sim.pt.contains(pid * NUM_PAGES + page) for page in range(NUM_PAGES))
+            if resident != quota:
+                failures.append(f'{pra}: process {pid} holds {resident} frames, its quota is {quota}')
+    return failures
+
+def checkReadAhead():
+    """ Read-ahead never evicts the page that just faulted, so repeating it is never a fault. """
+    failures = []
+    trace = workload(4000, 7)
+    for pra in memSim.POLICIES:
+        if pra == 'opt': # no prefetching with opt
+            continue
+        for name in memSim.PREFETCHERS:
+            memory = memSim.RAM(size=8)
+            disk = memSim.Disk(BACKING_STORE)
+            output = memSim.OutputWriter(memory, level='stats', filename=os.devnull)
+            sim = memSim.Simulator(memSim.makePageTable('flat', NUM_PAGES, 8), memSim.TLB(), memory, disk,
+                                   memSim.makePolicy(pra, 8), output, prefetcher=memSim.makePrefetcher(name, 32))
+            refaults = 0
+            pages = memSim.tracePages(trace, memSim.PAGE_SIZE)
+            for i, address in enumerate(trace):
+                faults = sim.pageFaults
+                sim.run([address])
+                if i and pages[i] == pages[i - 1] and sim.pageFaults > faults:
+                    refaults += 1
+            output.close()
+            disk.close()
+            if refaults:
+                failures.append(f'{pra} --prefetch {name}: {refaults} repeated references faulted again')
+    return failures
+
+def checkServerSpaces():
+    """ A server client that leaves takes its pages with it, the next one with its id starts empty. """
+    failures = []
+    socket = os.path.join(tempfile.mkdtemp(), 'memsim.sock')
+    first, second = workload(3000, 1, writes=0.3), workload(3000, 2)
+    async def session(server, trace):
+        client = await memSim.SimClient.connect('unix:' + socket)
+        await client.translate(trace)
+        await client.close()
+        while server.clients: # until the server has seen the client go
+            await asyncio.sleep(0.01)
+    async def run(server):
+        listener = await asyncio.start_unix_server(server.handle, socket)
+        async with listener:
+            await session(server, first)
+            sim = server.sim
+            leftovers = [name for name, left in (('pages', sim.pt.frameToPage), ('TLB entries', sim.tlb.index),
+                                                  ('overlay pages', sim.disk.written)) if left]
+            if isinstance(sim.prefetcher, memSim.MarkovPrefetcher) and sim.prefetcher.successors:
+                leftovers.append('prefetch history')
+            faults = sim.pageFaults
+            await session(server, second)
+            return leftovers, sim.pageFaults - faults
+    for pra in memSim.POLICIES:
+        if pra == 'opt': # can't serve
+            continue
+        for prefetch in (None, 'markov'):
+            memory = memSim.RAM(size=16)
+            disk = memSim.Disk(BACKING_STORE, size=2**ADDRESS_BITS, batch=4)
+            output = memSim.OutputWriter(memory, level='stats', filename=os.devnull)
+            sim = memSim.Simulator(memSim.makePageTable('flat', NUM_PAGES, 16), memSim.TLB(), memory, disk,
+                                   memSim.makePolicy(pra, 16), memSim.ServerOutput(memory, output),
+                                   prefetcher=memSim.makePrefetcher(prefetch, None))
+            leftovers, faults = asyncio.run(run(memSim.SimServer(sim, ADDRESS_BITS, maxClients=1)))
+            name = pra + (f' --prefetch {prefetch}' if prefetch else '')
+            if leftovers:
+                failures.append(f'{name}: {", ".join(leftovers)} left behind by the first client')
+            pages = len(set(memSim.tracePages(second, memSim.PAGE_SIZE)))
+            if not prefetch and faults < pages:
+                failures.append(f'{name}: the second client faulted {faults} times on {pages} pages')
+            disk.close()
+    return failures
+
+def memSimOutput(*args):
+    """ (exit status, stdout, stderr) of memSim.py run with args. """
+    run = subprocess.run([sys.executable, os.path.join(ROOT, 'memSim.py'), *args], capture_output=True, cwd=ROOT)
+    return run.returncode, run.stdout, run.stderr
+
+def checkVectorized():
+    """ --vectorize prints exactly what the plain run prints, and is refused where it can't. """
+    try:
+        import numpy # noqa: F401
+    except ImportError:
+        return None # skipped
+    failures = []
+    trace = os.path.join(tempfile.mkdtemp(), 'runs.txt')
+    with open(trace, 'w') as f:
+        f.write(''.join(f'{address}\n' for address in workload(20000, 3, writes=0)))
+    for pra in memSim.POLICIES:
+        for options in ([], ['--tlb-fill', 'access'], ['--tlb-policy', 'lru', '--tlb-ways', '4']):
+            plain = memSimOutput(trace, '16', pra, *options)
+            vectorized = memSimOutput(trace, '16', pra, '--vectorize', *options)
+            if plain[0] or plain != vectorized:
+                failures.append(f'{pra} {" ".join(options)}: --vectorize output differs')
+    for pra in memSim.POLICIES:
+        if pra == 'opt':
+            continue
+        status, _, stderr = memSimOutput(trace, '16', pra, '--prefetch', 'sequential', '--vectorize')
+        if status != 2 or b'--vectorize' not in stderr:
+            failures.append(f'{pra}: --prefetch --vectorize should be refused')
+    return failures
+
+def checkPartialPage():
+    """ A backing store that ends part way into a page: the part it covers reads from the file. """
+    failures = []
+    with open(BACKING_STORE, 'rb') as f:
+        data = f.read(40000) # 9.77 pages of 4096 bytes, less than one of 131072
+    store = os.path.join(tempfile.mkdtemp(), 'short.bin')
+    with open(store, 'wb') as f:
+        f.write(data)
+    for pageSize in (4096, 131072):
+        disk = memSim.Disk(store, pageSize=pageSize, size=2 * pageSize * (len(data) // pageSize + 1))
+        tail = len(data) % pageSize
+        page = disk.getpage(len(data) // pageSize)
+        if len(page) != pageSize or page[:tail] != data[-tail:] or any(page[tail:]):
+            failures.append(f'--page-size {pageSize}: the last page of the backing store reads wrong')
+        page.release()
+        disk.close()
+    return failures
+
+CHECKS = [checkLocalReplacement, checkReadAhead, checkServerSpaces, checkVectorized, checkPartialPage]
+
+def main():
+    failed = 0
+    for check in CHECKS:
+        failures = check()
+        if failures is None:
+            print(f'{check.__name__:>24} skipped, needs numpy')
+            continue
+        print(f'{check.__name__:>24} {"FAILED" if failures else "ok"}')
+        for failure in failures:
+            print(f'    {failure}')
+        failed += bool(failures)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()